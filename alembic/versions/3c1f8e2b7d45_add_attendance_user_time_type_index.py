@@ -0,0 +1,29 @@
+"""Add composite index for attendance history lookups
+
+Revision ID: 3c1f8e2b7d45
+Revises: 92909e7f8327
+Create Date: 2025-07-14 10:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1f8e2b7d45'
+down_revision = '92909e7f8327'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_att_user_time_type',
+        'attendances',
+        ['user_id', 'attendance_time', 'attendance_type'],
+        unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_att_user_time_type', table_name='attendances')
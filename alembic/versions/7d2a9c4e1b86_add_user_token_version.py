@@ -0,0 +1,27 @@
+"""Add token version to users for token revocation
+
+Revision ID: 7d2a9c4e1b86
+Revises: 3c1f8e2b7d45
+Create Date: 2025-07-16 09:41:05.572913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2a9c4e1b86'
+down_revision = '3c1f8e2b7d45'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'users',
+        sa.Column('token_version', sa.Integer(), nullable=False, server_default='0')
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'token_version')
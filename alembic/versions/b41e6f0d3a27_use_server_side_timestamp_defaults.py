@@ -0,0 +1,46 @@
+"""Use server-side defaults for timestamp columns
+
+Revision ID: b41e6f0d3a27
+Revises: 7d2a9c4e1b86
+Create Date: 2025-07-16 14:08:22.901344
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b41e6f0d3a27'
+down_revision = '7d2a9c4e1b86'
+branch_labels = None
+depends_on = None
+
+TIMESTAMP_COLUMNS = [
+    ('users', 'created_at'),
+    ('users', 'updated_at'),
+    ('attendances', 'created_at'),
+    ('attendances', 'updated_at'),
+    ('attendances', 'attendance_time'),
+]
+
+
+def upgrade() -> None:
+    for table, column in TIMESTAMP_COLUMNS:
+        op.alter_column(
+            table,
+            column,
+            existing_type=sa.DateTime(),
+            existing_nullable=False,
+            server_default=sa.func.now()
+        )
+
+
+def downgrade() -> None:
+    for table, column in TIMESTAMP_COLUMNS:
+        op.alter_column(
+            table,
+            column,
+            existing_type=sa.DateTime(),
+            existing_nullable=False,
+            server_default=None
+        )
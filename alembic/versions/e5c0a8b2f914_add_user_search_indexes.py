@@ -0,0 +1,32 @@
+"""Add indexes for the admin user search
+
+Revision ID: e5c0a8b2f914
+Revises: b41e6f0d3a27
+Create Date: 2025-07-17 11:23:48.164027
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5c0a8b2f914'
+down_revision = 'b41e6f0d3a27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_users_is_active', 'users', ['is_active'], unique=False)
+    op.create_index(
+        'ix_users_fulltext',
+        'users',
+        ['username', 'email'],
+        unique=False,
+        mysql_prefix='FULLTEXT'
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_fulltext', table_name='users')
+    op.drop_index('ix_users_is_active', table_name='users')
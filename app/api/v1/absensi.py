@@ -1,17 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from app.database.database import get_db
-from app.services.v1.face_recognition_service import FaceRecognitionService
+from app.database.database import get_sync_db as get_db
+from app.services.v1.face_recognition_service import get_face_service
+from app.services.face_recognition_service import run_face_task
 from app.api.v1.auth import get_current_user
 from app.models.user import User
 from pydantic import BaseModel
-import base64
 from datetime import datetime, timezone
+from app.schemas._validators import FaceImage
+from app.utils.face_encoding import l2_normalize
 
 router = APIRouter()
 
 class AttendanceVerify(BaseModel):
-    face_image: str  # Base64 encoded image
+    face_image: FaceImage  # Base64 encoded image, decoded on validation
 
 @router.post("/verify-attendance")
 async def verify_attendance(
@@ -26,19 +28,23 @@ async def verify_attendance(
         )
 
     try:
-        # Decode base64 image
-        image_data = base64.b64decode(attendance.face_image)
+        # Get shared face recognition service
+        face_service = get_face_service()
         
-        # Initialize face recognition service
-        face_service = FaceRecognitionService()
+        # Preprocess the new image and extract its encoding
+        processed_image = await run_face_task(face_service.preprocess_image, attendance.face_image)
+        new_encoding = await run_face_task(face_service.extract_face_encoding, processed_image)
         
-        # Preprocess the new image
-        processed_image = face_service.preprocess_image(image_data)
+        if new_encoding is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No face detected in the image"
+            )
         
         # Verify face
-        is_match, confidence = face_service.verify_face(
-            stored_encoding=current_user.face_encoding.tobytes(),
-            new_image_data=processed_image
+        is_match, confidence = face_service.verify_face_cosine(
+            stored_unit=face_service.load_unit_encoding(current_user.face_encoding),
+            new_unit=l2_normalize(new_encoding)
         )
 
         if not is_match:
@@ -56,7 +62,9 @@ async def verify_attendance(
             "confidence": confidence
         }
 
-    except Exception as e:
+    except HTTPException:
+        raise
+    except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Error processing face verification: {str(e)}"
@@ -1,13 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from typing import Optional
-from app.database.database import get_db
+from app.database.database import get_sync_db as get_db
 from app.services.v1.auth_service import AuthService
-from app.services.v1.face_recognition_service import FaceRecognitionService
+from app.services.v1.face_recognition_service import get_face_service
+from app.services.face_recognition_service import run_face_task
 from pydantic import BaseModel
-import base64
 from app.models.user import User
+from app.schemas._validators import FaceImage
+from app.utils.face_encoding import quantize_int8, l2_normalize
 
 router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -16,7 +19,7 @@ class UserCreate(BaseModel):
     username: str
     email: str
     password: str
-    face_image: Optional[str] = None  # Base64 encoded image
+    face_image: Optional[FaceImage] = None  # Base64 encoded image, decoded on validation
 
 class Token(BaseModel):
     access_token: str
@@ -25,7 +28,7 @@ class Token(BaseModel):
 @router.post("/register", response_model=Token)
 async def register(user: UserCreate, db: Session = Depends(get_db)):
     # Check if username already exists
-    existing_user = db.query(User).filter(User.username == user.username).first()
+    existing_user = db.scalar(select(User.id).where(User.username == user.username))
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -35,22 +38,21 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
     face_encoding = None
     if user.face_image:
         try:
-            # Decode base64 image
-            image_data = base64.b64decode(user.face_image)
-            
-            # Initialize face recognition service
-            face_service = FaceRecognitionService()
+            # Get shared face recognition service
+            face_service = get_face_service()
             
             # Preprocess and extract face encoding
-            processed_image = face_service.preprocess_image(image_data)
-            face_encoding = face_service.extract_face_encoding(processed_image)
+            processed_image = await run_face_task(face_service.preprocess_image, user.face_image)
+            face_encoding = await run_face_task(face_service.extract_face_encoding, processed_image)
             
             if face_encoding is None:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="No face detected in the image"
                 )
-        except Exception as e:
+        except HTTPException:
+            raise
+        except ValueError as e:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Error processing face image: {str(e)}"
@@ -62,7 +64,7 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
         username=user.username,
         email=user.email,
         password=user.password,
-        face_encoding=face_encoding.tobytes() if face_encoding is not None else None
+        face_encoding=quantize_int8(l2_normalize(face_encoding)) if face_encoding is not None else None
     )
 
     # Create access token
@@ -74,7 +76,7 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
 
 @router.post("/token", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = AuthService.authenticate_user(db, form_data.username, form_data.password)
+    user = await AuthService.authenticate_user_async(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -103,7 +105,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     if username is None:
         raise credentials_exception
     
-    user = db.query(User).filter(User.username == username).first()
+    user = db.scalar(select(User).where(User.username == username))
     if user is None:
         raise credentials_exception
     
@@ -1,13 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Path
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Any, List, Optional
 from datetime import datetime, date
-from fastapi_pagination import Page, paginate
+from fastapi_pagination import Page
+from fastapi_pagination.ext.sqlalchemy import paginate
 
 from app.database.database import get_db
 from app.services.attendance_service import AttendanceService
-from app.services.face_recognition_service import FaceRecognitionService
+from app.services.face_recognition_service import get_face_service, run_face_task
 from app.core.security import get_current_active_user
+from app.api.v1.endpoints.users import clear_me_detailed_cache
+from app.core.verification_cache import (
+    verification_key,
+    get_cached_verification,
+    cache_verification
+)
 from app.schemas.attendance import (
     AttendanceCreate,
     AttendanceResponse,
@@ -25,24 +32,37 @@ router = APIRouter()
 async def verify_attendance(
     attendance_data: AttendanceVerify,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> Any:
     """
     Verify user attendance with face recognition and record it
     """
-    if not current_user.face_encoding:
+    # The encoding is deferred on the authenticated user and loads here
+    stored_encoding = await current_user.awaitable_attrs.face_encoding
+    if not stored_encoding:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="No registered face found for this user"
         )
 
     try:
-        # Verify face
-        face_service = FaceRecognitionService()
-        is_match, confidence = face_service.verify_face_from_base64(
-            stored_encoding=current_user.face_encoding,
-            base64_image=attendance_data.face_image
+        # Reuse the result of a retried submission of the same image
+        cache_key = verification_key(
+            current_user.id, attendance_data.face_image, stored_encoding
         )
+        cached = get_cached_verification(cache_key)
+        
+        # Verify face
+        face_service = get_face_service()
+        if cached is not None:
+            is_match, confidence = cached
+        else:
+            is_match, confidence = await run_face_task(
+                face_service.verify_face_from_bytes,
+                stored_encoding,
+                attendance_data.face_image
+            )
+            cache_verification(cache_key, is_match, confidence)
 
         if not is_match:
             logger.warning(f"Face verification failed for user {current_user.username}")
@@ -52,7 +72,7 @@ async def verify_attendance(
             )
 
         # Create attendance record
-        attendance = AttendanceService.create_attendance(
+        attendance = await AttendanceService.create_attendance(
             db=db,
             user_id=current_user.id,
             attendance_type=attendance_data.attendance_type,
@@ -62,11 +82,16 @@ async def verify_attendance(
             ip_address=attendance_data.ip_address
         )
         
+        # The detailed profile lists recent attendance
+        await clear_me_detailed_cache(current_user.id)
+        
         return attendance
-    except Exception as e:
+    except HTTPException:
+        raise
+    except ValueError as e:
         logger.error(f"Error processing attendance verification: {str(e)}")
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Error processing attendance verification: {str(e)}"
         )
 
@@ -77,21 +102,21 @@ async def get_attendance_history(
     end_date: Optional[date] = Query(None, description="Filter by end date"),
     attendance_type: Optional[AttendanceType] = Query(None, description="Filter by attendance type"),
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> Any:
     """
     Get attendance history for the current user with filtering options
     """
     try:
-        attendances = AttendanceService.get_user_attendances(
-            db=db,
+        query = AttendanceService.user_attendances_query(
             user_id=current_user.id,
             start_date=start_date,
             end_date=end_date,
             attendance_type=attendance_type
         )
         
-        return paginate(attendances)
+        # LIMIT/OFFSET and the total count are run in the database
+        return await paginate(db, query)
     except Exception as e:
         logger.error(f"Error retrieving attendance history: {str(e)}")
         raise HTTPException(
@@ -105,7 +130,7 @@ async def get_attendance_statistics(
     month: Optional[int] = Query(None, ge=1, le=12, description="Month (1-12)"),
     year: Optional[int] = Query(None, ge=2000, le=2100, description="Year"),
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> Any:
     """
     Get attendance statistics for the current user
@@ -117,7 +142,7 @@ async def get_attendance_statistics(
             month = month or now.month
             year = year or now.year
             
-        stats = AttendanceService.get_attendance_statistics(
+        stats = await AttendanceService.get_attendance_statistics(
             db=db,
             user_id=current_user.id,
             month=month,
@@ -137,12 +162,12 @@ async def get_attendance_statistics(
 async def get_attendance(
     attendance_id: int = Path(..., description="The ID of the attendance record"),
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> Any:
     """
     Get a specific attendance record by ID
     """
-    attendance = AttendanceService.get_attendance_by_id(db, attendance_id)
+    attendance = await AttendanceService.get_attendance_by_id(db, attendance_id)
     
     if not attendance:
         raise HTTPException(
@@ -164,7 +189,7 @@ async def get_attendance(
 async def delete_attendance(
     attendance_id: int = Path(..., description="The ID of the attendance record to delete"),
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> None:
     """
     Delete an attendance record (admin only)
@@ -175,12 +200,14 @@ async def delete_attendance(
             detail="Not authorized to delete attendance records"
         )
     
-    attendance = AttendanceService.get_attendance_by_id(db, attendance_id)
+    attendance = await AttendanceService.get_attendance_by_id(db, attendance_id)
     if not attendance:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Attendance record not found"
         )
     
-    AttendanceService.delete_attendance(db, attendance_id)
+    user_id = attendance.user_id
+    await AttendanceService.delete_attendance(db, attendance_id)
+    await clear_me_detailed_cache(user_id)
     return None 
\ No newline at end of file
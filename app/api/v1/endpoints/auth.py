@@ -1,19 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Body, Header
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Body, Header
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
 from typing import Optional, Any
 from pydantic import EmailStr
 from datetime import datetime, timezone
-from jose import jwt, JWTError
+import jwt
+from jwt import InvalidTokenError
 
 from app.database.database import get_db
 from app.services.auth_service import AuthService
-from app.services.face_recognition_service import FaceRecognitionService
+from app.services.face_recognition_service import get_face_service, run_face_task
 from app.core.security import (
     get_current_active_user, 
     create_access_token, 
+    access_token_claims,
+    user_info_dict,
+    refresh_token_claims,
     create_refresh_token,
-    verify_password,
+    verify_password_async,
+    verify_user_password,
+    password_needs_update,
     create_password_reset_token,
     verify_password_reset_token
 )
@@ -32,22 +40,25 @@ from app.schemas.user import UserResponse, MobileUserResponse
 from app.models.user import User
 from app.core.config import settings
 from app.core.logger import logger
+from app.core.token_cache import get_cached_user, cache_user
+from app.core.user_cache import get_cached_user_by_id, cache_user_row
 
 router = APIRouter()
 
 @router.post("/login-json", response_model=LoginResponse)
 async def login_json(
     login_data: UserLogin,
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
 ) -> Any:
     """
     JSON compatible login endpoint for frontend applications
     """
     # Get user by email
     email = login_data.email
-    user = AuthService.get_user_by_email(db, email)
+    user = await AuthService.get_auth_user_by_email(db, email)
     
-    if not user or not verify_password(login_data.password, getattr(user, "hashed_password")):
+    if not await verify_user_password(login_data.password, user):
         logger.warning(f"Failed login attempt for email: {login_data.email}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -55,77 +66,66 @@ async def login_json(
         )
     
     # Check if user is active
-    is_active = getattr(user, "is_active")
+    is_active = user.is_active
     if not is_active:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="User account is disabled"
         )
     
-    # Update last login
-    setattr(user, "last_login", datetime.now(timezone.utc))
-    db.commit()
+    # Update last login after the response is sent
+    login_time = datetime.now(timezone.utc)
+    background_tasks.add_task(AuthService.touch_last_login, user.id, login_time)
+    # Move hashes made with older settings, such as bcrypt, to the current scheme
+    if password_needs_update(user.hashed_password):
+        background_tasks.add_task(AuthService.rehash_password, user.id, login_data.password)
     
     # Create user info
-    user_info = UserInfo(
-        id=getattr(user, "id"),
-        name=getattr(user, "name") or "",
-        email=getattr(user, "email"),
-        username=getattr(user, "username"),
-        is_active=getattr(user, "is_active"),
-        position=getattr(user, "position"),
-        employee_id=getattr(user, "employee_id"),
-        phone=getattr(user, "phone"),
-        address=getattr(user, "address"),
-        profile_picture=getattr(user, "profile_picture"),
-        additional_data=getattr(user, "additional_data"),
-        last_login=getattr(user, "last_login")
-    )
+    user_info = user_info_dict(user)
+    user_info["last_login"] = login_time
     
-    return {
-        "access_token": create_access_token(user.username),
-        "refresh_token": create_refresh_token(user.username),
+    # Returned as-is, LoginResponse only documents the shape
+    return ORJSONResponse({
+        "access_token": create_access_token(user.username, access_token_claims(user)),
+        "refresh_token": create_refresh_token(user.username, refresh_token_claims(user)),
         "token_type": "bearer",
         "user": user_info,
         "message": "Login successful",
         "status": "success"
-    }
+    })
 
 @router.post("/register", response_model=Token, status_code=status.HTTP_201_CREATED)
 async def register(
     user_data: UserCreate,
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
 ) -> Any:
     """
     Register a new user with username, email, password and optional face image
     """
-    # Check if username already exists
-    if AuthService.get_user_by_username(db, user_data.username):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username already registered"
-        )
-    
-    # Check if email already exists
-    if AuthService.get_user_by_email(db, user_data.email):
+    # Check if username or email already exists
+    conflict = await AuthService.get_registration_conflict(db, user_data.username, user_data.email)
+    if conflict:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered"
+            detail=f"{conflict.capitalize()} already registered"
         )
 
     face_encoding = None
     if user_data.face_image:
         try:
             # Process face image
-            face_service = FaceRecognitionService()
-            face_encoding = face_service.process_face_image(user_data.face_image)
+            face_service = get_face_service()
+            face_encoding = await run_face_task(face_service.process_face_image, user_data.face_image)
             
             if face_encoding is None:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="No face detected in the image"
                 )
-        except Exception as e:
+        except HTTPException:
+            raise
+        except ValueError as e:
             logger.error(f"Error processing face image: {str(e)}")
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -134,37 +134,39 @@ async def register(
 
     # Create new user
     try:
-        user = AuthService.create_user(
+        user = await AuthService.create_user(
             db=db,
             user_data=user_data,
             face_encoding=face_encoding
         )
         
         # Create access token
-        access_token = create_access_token(user.username)
-        refresh_token = create_refresh_token(user.username)
+        access_token = create_access_token(user.username, access_token_claims(user))
+        refresh_token = create_refresh_token(user.username, refresh_token_claims(user))
         
-        # Update last login
-        setattr(user, "last_login", datetime.now(timezone.utc))
-        db.commit()
+        # Update last login after the response is sent
+        background_tasks.add_task(
+            AuthService.touch_last_login, user.id, datetime.now(timezone.utc)
+        )
         
         return {
             "access_token": access_token,
             "refresh_token": refresh_token,
             "token_type": "bearer"
         }
-    except Exception as e:
-        logger.error(f"Error registering user: {str(e)}")
+    except IntegrityError:
+        # A concurrent registration took the username or email
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Error registering user"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Username or email already registered"
         )
 
 
 @router.post("/login", response_model=Token)
 async def login(
+    background_tasks: BackgroundTasks,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> Any:
     """
     OAuth2 compatible token login, get an access token for future requests
@@ -174,9 +176,9 @@ async def login(
     email = form_data.username
     
     # Authenticate with email instead of username
-    user = AuthService.get_user_by_email(db, email)
+    user = await AuthService.get_auth_user_by_email(db, email)
     
-    if not user or not verify_password(form_data.password, getattr(user, "hashed_password")):
+    if not await verify_user_password(form_data.password, user):
         logger.warning(f"Failed login attempt for email: {email}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -185,20 +187,24 @@ async def login(
         )
     
     # Check if user is active
-    is_active = getattr(user, "is_active")
+    is_active = user.is_active
     if not is_active:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="User account is disabled"
         )
     
-    # Update last login
-    setattr(user, "last_login", datetime.now(timezone.utc))
-    db.commit()
+    # Update last login after the response is sent
+    background_tasks.add_task(
+        AuthService.touch_last_login, user.id, datetime.now(timezone.utc)
+    )
+    # Move hashes made with older settings, such as bcrypt, to the current scheme
+    if password_needs_update(user.hashed_password):
+        background_tasks.add_task(AuthService.rehash_password, user.id, form_data.password)
     
     return {
-        "access_token": create_access_token(user.username),
-        "refresh_token": create_refresh_token(user.username),
+        "access_token": create_access_token(user.username, access_token_claims(user)),
+        "refresh_token": create_refresh_token(user.username, refresh_token_claims(user)),
         "token_type": "bearer"
     }
 
@@ -206,17 +212,16 @@ async def login(
 @router.post("/face-login", response_model=Token)
 async def face_login(
     login_data: FaceLoginRequest,
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
 ) -> Any:
     """
     Login using face recognition
     """
     # Get user by username or email
-    user = None
-    if login_data.username:
-        user = AuthService.get_user_by_username(db, login_data.username)
-    elif login_data.email:
-        user = AuthService.get_user_by_email(db, login_data.email)
+    user = await AuthService.get_user_by_identifier(
+        db, username=login_data.username, email=login_data.email
+    )
     
     if not user:
         raise HTTPException(
@@ -224,14 +229,14 @@ async def face_login(
             detail="User not found"
         )
     
-    face_encoding = getattr(user, "face_encoding")
+    face_encoding = user.face_encoding
     if not face_encoding:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="No face registered for this user"
         )
     
-    is_active = getattr(user, "is_active")
+    is_active = user.is_active
     if not is_active:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -240,10 +245,11 @@ async def face_login(
     
     try:
         # Verify face
-        face_service = FaceRecognitionService()
-        is_match, confidence = face_service.verify_face(
-            stored_encoding=getattr(user, "face_encoding"),
-            new_image_data=bytes(login_data.face_image, 'utf-8')
+        face_service = get_face_service()
+        is_match, confidence = await run_face_task(
+            face_service.verify_face_from_bytes,
+            user.face_encoding,
+            login_data.face_image
         )
         
         if not is_match:
@@ -253,19 +259,22 @@ async def face_login(
                 detail="Face verification failed"
             )
         
-        # Update last login
-        setattr(user, "last_login", datetime.now(timezone.utc))
-        db.commit()
+        # Update last login after the response is sent
+        background_tasks.add_task(
+            AuthService.touch_last_login, user.id, datetime.now(timezone.utc)
+        )
         
         return {
-            "access_token": create_access_token(user.username),
-            "refresh_token": create_refresh_token(user.username),
+            "access_token": create_access_token(user.username, access_token_claims(user)),
+            "refresh_token": create_refresh_token(user.username, refresh_token_claims(user)),
             "token_type": "bearer"
         }
-    except Exception as e:
+    except HTTPException:
+        raise
+    except ValueError as e:
         logger.error(f"Error in face login: {str(e)}")
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code=status.HTTP_400_BAD_REQUEST,
             detail="Error processing face verification"
         )
 
@@ -273,7 +282,7 @@ async def face_login(
 @router.post("/refresh", response_model=Token)
 async def refresh_token(
     refresh_token: str = Body(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> Any:
     """
     Refresh access token
@@ -290,20 +299,22 @@ async def refresh_token(
         
         username: str = str(sub)
         
-        user = AuthService.get_user_by_username(db, username)
-        is_active = user and getattr(user, "is_active")
-        if not user or not is_active:
+        user = await AuthService.get_auth_user_by_username(db, username)
+        is_active = user and user.is_active
+        if not user or not is_active or payload.get("ver", 0) != user.token_version:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid refresh token"
             )
         
         return {
-            "access_token": create_access_token(username),
-            "refresh_token": create_refresh_token(username),
+            "access_token": create_access_token(username, access_token_claims(user)),
+            "refresh_token": create_refresh_token(username, refresh_token_claims(user)),
             "token_type": "bearer"
         }
-    except Exception as e:
+    except HTTPException:
+        raise
+    except InvalidTokenError as e:
         logger.error(f"Error refreshing token: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -314,12 +325,12 @@ async def refresh_token(
 @router.post("/password-reset", status_code=status.HTTP_202_ACCEPTED)
 async def request_password_reset(
     email: EmailStr = Body(..., embed=True),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> Any:
     """
     Request password reset for user (sends email with reset token)
     """
-    user = AuthService.get_user_by_email(db, email)
+    user = await AuthService.get_auth_user_by_email(db, email)
     if user:
         # In a real app, send an email with reset token
         # For this example, we'll just log it
@@ -333,7 +344,7 @@ async def request_password_reset(
 @router.post("/password-reset/confirm", status_code=status.HTTP_200_OK)
 async def reset_password(
     password_data: PasswordReset,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> Any:
     """
     Reset password using reset token
@@ -346,16 +357,18 @@ async def reset_password(
                 detail="Invalid token"
             )
         
-        user = AuthService.get_user_by_email(db, email)
+        user = await AuthService.get_auth_user_by_email(db, email)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User not found"
             )
         
-        AuthService.update_user_password(db, user, password_data.new_password)
+        await AuthService.update_user_password(db, user, password_data.new_password)
         return {"message": "Password updated successfully"}
-    except Exception as e:
+    except HTTPException:
+        raise
+    except ValueError as e:
         logger.error(f"Error resetting password: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -367,25 +380,27 @@ async def reset_password(
 async def change_password(
     password_data: PasswordChange,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> Any:
     """
     Change user password (requires authentication)
     """
-    if not verify_password(password_data.current_password, getattr(current_user, "hashed_password")):
+    # The hash is not kept in the user caches, so it may still need loading
+    hashed_password = await current_user.awaitable_attrs.hashed_password
+    if not await verify_password_async(password_data.current_password, hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Incorrect current password"
         )
     
-    AuthService.update_user_password(db, current_user, password_data.new_password)
+    await AuthService.update_user_password(db, current_user, password_data.new_password)
     return {"message": "Password updated successfully"} 
 
 
 @router.post("/validate-token")
 async def validate_token(
     authorization: str = Header(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> Any:
     """
     Validate access token and return user information if valid
@@ -398,39 +413,43 @@ async def validate_token(
     token = authorization.replace("Bearer ", "")
     
     try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
-        )
-        sub = payload.get("sub")
-        token_type = payload.get("type")
-        
-        if sub is None or token_type != "access":
-            return {"success": False, "message": "Invalid token"}
-        
-        username: str = str(sub)
+        # Reuse the result of a recent validation of the same token
+        user = await get_cached_user(token)
+        if user is None:
+            payload = jwt.decode(
+                token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
+            )
+            sub = payload.get("sub")
+            token_type = payload.get("type")
             
-        user = AuthService.get_user_by_username(db, username)
-        if not user:
-            return {"success": False, "message": "User not found"}
+            if sub is None or token_type != "access":
+                return {"success": False, "message": "Invalid token"}
+            
+            username: str = str(sub)
+            
+            # Polling clients are usually answered from the cached user row
+            user_id = payload.get("uid")
+            user = await get_cached_user_by_id(user_id) if user_id is not None else None
+            if user is None or user.username != username:
+                user = await AuthService.get_auth_user_by_username(db, username)
+                if not user:
+                    return {"success": False, "message": "User not found"}
+                await cache_user_row(user)
+            
+            # Tokens issued before the user's token version was bumped are revoked
+            if payload.get("ver", 0) != (user.token_version or 0):
+                return {"success": False, "message": "Invalid token"}
+            
+            cache_user(token, user, payload.get("exp"))
         
-        is_active = getattr(user, "is_active")
+        is_active = user.is_active
         if not is_active:
             return {"success": False, "message": "User account is disabled"}
         
         # Create user info matching mobile app expectations
-        user_info = {
-            "id": getattr(user, "id"),
-            "name": getattr(user, "name") or "",
-            "email": getattr(user, "email"),
-            "username": getattr(user, "username"),
-            "is_active": getattr(user, "is_active"),
-            "position": getattr(user, "position"),
-            "employee_id": getattr(user, "employee_id"),
-            "phone": getattr(user, "phone"),
-            "address": getattr(user, "address"),
-            "profile_picture": getattr(user, "profile_picture"),
-            "additional_data": getattr(user, "additional_data"),
-        }
+        user_info = UserInfo.model_validate(user, from_attributes=True).model_dump(
+            exclude={"last_login"}
+        )
         
         return {
             "success": True,
@@ -440,6 +459,6 @@ async def validate_token(
             }
         }
         
-    except JWTError:
+    except InvalidTokenError:
         return {"success": False, "message": "Invalid token"} 
 
@@ -1,10 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Path
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
 from typing import Any, List, Optional
-from fastapi_pagination import Page, paginate
+from fastapi_pagination import Page
+from fastapi_pagination.cursor import CursorPage
+from fastapi_pagination.ext.sqlalchemy import paginate
+from fastapi_cache import FastAPICache
+from fastapi_cache.decorator import cache
 
 from app.database.database import get_db
 from app.services.user_service import UserService
+from app.services.auth_service import AuthService
 from app.core.security import get_current_active_user, get_current_active_superuser
 from app.schemas.user import (
     UserResponse,
@@ -18,6 +24,18 @@ from app.core.logger import logger
 router = APIRouter()
 
 
+def me_detailed_key_builder(func, namespace: str = "", *, kwargs=None, **_) -> str:
+    """Key the detailed profile cache on the authenticated user, never the URL"""
+    return f"{namespace}:{kwargs['current_user'].id}:detail"
+
+
+async def clear_me_detailed_cache(user_id: int) -> None:
+    """Drop the cached detailed profile of one user by its exact key"""
+    # A namespace clear scans every key on Redis and also matches longer ids
+    key = f"{FastAPICache.get_prefix()}:me-detailed:{user_id}:detail"
+    await FastAPICache.get_backend().clear(key=key)
+
+
 @router.get("/me", response_model=UserResponse)
 async def get_current_user_info(
     current_user: User = Depends(get_current_active_user)
@@ -32,17 +50,20 @@ async def get_current_user_info(
 async def update_current_user(
     user_data: UserUpdate,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> Any:
     """
     Update current user information
     """
     try:
-        updated_user = UserService.update_user(
+        # Users cannot grant themselves admin rights or change their own status
+        updated_user = await UserService.update_user(
             db=db, 
             user=current_user,
-            user_data=user_data
+            user_data=user_data,
+            exclude={"is_superuser", "is_active"}
         )
+        await clear_me_detailed_cache(updated_user.id)
         return updated_user
     except Exception as e:
         logger.error(f"Error updating user: {str(e)}")
@@ -53,16 +74,19 @@ async def update_current_user(
 
 
 @router.get("/me/detailed", response_model=UserWithAttendance)
+@cache(expire=30, namespace="me-detailed", key_builder=me_detailed_key_builder)
 async def get_current_user_detailed(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> Any:
     """
     Get detailed user information including recent attendance
     """
     try:
         user_id = getattr(current_user, "id")
-        return UserService.get_user_with_attendance(db, user_id)
+        user = await UserService.get_user_with_attendance(db, user_id)
+        # Cached responses are stored as JSON, so serialize the ORM object here
+        return UserWithAttendance.model_validate(user, from_attributes=True).model_dump(mode="json")
     except Exception as e:
         logger.error(f"Error retrieving detailed user info: {str(e)}")
         raise HTTPException(
@@ -77,45 +101,65 @@ async def get_users(
     search: Optional[str] = Query(None, description="Search by username or email"),
     is_active: Optional[bool] = Query(None, description="Filter by active status"),
     current_user: User = Depends(get_current_active_superuser),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> Any:
     """
     Get all users (admin only)
     """
-    users = UserService.get_users(
-        db=db,
+    query = UserService.users_query(
         search=search,
         is_active=is_active
     )
-    return paginate(users)
+    
+    # LIMIT/OFFSET and the total count are run in the database
+    return await paginate(db, query)
+
+
+@router.get("/cursor", response_model=CursorPage[UserResponse])
+async def get_users_cursor(
+    search: Optional[str] = Query(None, description="Search by username or email"),
+    is_active: Optional[bool] = Query(None, description="Filter by active status"),
+    current_user: User = Depends(get_current_active_superuser),
+    db: AsyncSession = Depends(get_db)
+) -> Any:
+    """
+    Get all users with cursor pagination (admin only)
+    Pages are keyed on users.id, so deep pages cost the same as the first one
+    and no total count is computed. Page size is capped at 100.
+    """
+    query = UserService.users_query(
+        search=search,
+        is_active=is_active
+    )
+    return await paginate(db, query)
 
 
 @router.post("/", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 async def create_user(
     user_data: UserCreate,
     current_user: User = Depends(get_current_active_superuser),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> Any:
     """
     Create a new user (admin only)
     """
-    # Check if username already exists
-    if UserService.get_by_username(db, user_data.username):
+    # Check if username or email already exists
+    conflict = await AuthService.get_registration_conflict(db, user_data.username, user_data.email)
+    if conflict:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username already registered"
+            detail=f"{conflict.capitalize()} already registered"
         )
     
-    # Check if email already exists
-    if UserService.get_by_email(db, user_data.email):
+    try:
+        user = await UserService.create_user(db=db, user_data=user_data)
+        return user
+    except IntegrityError:
+        # A concurrent request took the username or email
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered"
+            detail="Username or email already registered"
         )
-    
-    try:
-        user = UserService.create_user(db=db, user_data=user_data)
-        return user
     except Exception as e:
         logger.error(f"Error creating user: {str(e)}")
         raise HTTPException(
@@ -128,12 +172,12 @@ async def create_user(
 async def get_user(
     user_id: int = Path(..., description="The ID of the user"),
     current_user: User = Depends(get_current_active_superuser),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> Any:
     """
     Get user by ID (admin only)
     """
-    user = UserService.get_by_id(db, user_id)
+    user = await UserService.get_by_id_cached(db, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -147,12 +191,12 @@ async def update_user(
     user_data: UserUpdate,
     user_id: int = Path(..., description="The ID of the user to update"),
     current_user: User = Depends(get_current_active_superuser),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> Any:
     """
     Update user information (admin only)
     """
-    user = UserService.get_by_id(db, user_id)
+    user = await UserService.get_by_id(db, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -160,7 +204,8 @@ async def update_user(
         )
     
     try:
-        updated_user = UserService.update_user(db=db, user=user, user_data=user_data)
+        updated_user = await UserService.update_user(db=db, user=user, user_data=user_data)
+        await clear_me_detailed_cache(user_id)
         return updated_user
     except Exception as e:
         logger.error(f"Error updating user: {str(e)}")
@@ -174,12 +219,12 @@ async def update_user(
 async def delete_user(
     user_id: int = Path(..., description="The ID of the user to delete"),
     current_user: User = Depends(get_current_active_superuser),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> None:
     """
     Delete user (admin only)
     """
-    user = UserService.get_by_id(db, user_id)
+    user = await UserService.get_by_id(db, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -193,5 +238,6 @@ async def delete_user(
             detail="Cannot delete your own user account"
         )
     
-    UserService.delete_user(db, user_id)
+    await UserService.delete_user(db, user_id)
+    await clear_me_detailed_cache(user_id)
     return None 
\ No newline at end of file
@@ -1,69 +1,84 @@
 import sys
 import os
 from loguru import logger
+from decouple import config
 from app.core.config import settings
 
 # Remove default handlers
 logger.remove()
 
+# Emit one JSON object per line for log shippers when enabled
+LOG_JSON = config("LOG_JSON", cast=bool, default=False)
+
 # Configure log format
 LOG_FORMAT = "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>"
 
+
+def format_record(record) -> str:
+    """Append bound context to the message, only for records that are emitted"""
+    extra = record["extra"]
+    if not extra:
+        return LOG_FORMAT + "\n{exception}"
+    # Records are shared between sinks and serialized as they are, so the
+    # context goes into the format string, with braces and tags escaped
+    context = " | ".join(f"{k}={v}" for k, v in extra.items())
+    context = context.replace("{", "{{").replace("}", "}}").replace("<", "\\<")
+    return LOG_FORMAT + f" [{context}]\n{{exception}}"
+
+
 # Add console handler
 logger.add(
     sys.stderr,
-    format=LOG_FORMAT,
+    format=format_record,
     level=settings.LOG_LEVEL,
     backtrace=True,
     diagnose=True,
+    enqueue=True,
 )
 
-# Add file handler
+# Add file handler, written from a background queue
 log_file_path = os.path.join(settings.LOG_DIR, "app.log")
 logger.add(
     log_file_path,
     rotation="10 MB",
     retention="7 days",
-    format=LOG_FORMAT,
+    format=format_record,
     level=settings.LOG_LEVEL,
     backtrace=True,
     diagnose=True,
+    enqueue=True,
+    serialize=LOG_JSON,
 )
 
 # Create a class for context-based logging
 class ContextLogger:
     def __init__(self, context=None):
         self.context = context or {}
+        self._logger = logger.bind(**self.context)
     
     def bind(self, **kwargs):
         """Bind additional context to the logger"""
         self.context.update(kwargs)
+        self._logger = logger.bind(**self.context)
         return self
     
-    def _format_message(self, message):
-        """Format message with context if available"""
-        if self.context:
-            context_str = " | ".join(f"{k}={v}" for k, v in self.context.items())
-            return f"{message} [{context_str}]"
-        return message
-    
     def debug(self, message, *args, **kwargs):
-        logger.debug(self._format_message(message), *args, **kwargs)
+        self._logger.opt(depth=1).debug(message, *args, **kwargs)
     
     def info(self, message, *args, **kwargs):
-        logger.info(self._format_message(message), *args, **kwargs)
+        self._logger.opt(depth=1).info(message, *args, **kwargs)
     
     def warning(self, message, *args, **kwargs):
-        logger.warning(self._format_message(message), *args, **kwargs)
+        self._logger.opt(depth=1).warning(message, *args, **kwargs)
     
     def error(self, message, *args, **kwargs):
-        logger.error(self._format_message(message), *args, **kwargs)
+        self._logger.opt(depth=1).error(message, *args, **kwargs)
     
     def exception(self, message, *args, **kwargs):
-        logger.exception(self._format_message(message), *args, **kwargs)
+        self._logger.opt(depth=1).exception(message, *args, **kwargs)
     
     def critical(self, message, *args, **kwargs):
-        logger.critical(self._format_message(message), *args, **kwargs)
+        self._logger.opt(depth=1).critical(message, *args, **kwargs)
 
 
 # Export the logger
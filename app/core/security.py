@@ -1,20 +1,50 @@
 from datetime import datetime, timedelta, timezone
-from typing import Any, Optional, Union
+from functools import lru_cache
+from typing import Any, Dict, Optional, Union
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
+from fastapi.concurrency import run_in_threadpool
+import jwt
+from jwt import InvalidTokenError
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
-from sqlalchemy import false
+from decouple import config
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer
+from sqlalchemy import bindparam, false, select, true
 
 from app.database.database import get_db
 from app.core.config import settings
 from app.models.user import User
+from app.schemas.auth import UserInfo
 from app.core.logger import logger
-
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from app.core.token_cache import get_cached_user, cache_user
+from app.core.user_cache import get_cached_user_by_id, cache_user_row
+
+# Password hashing: new hashes use argon2id, existing bcrypt hashes still verify
+BCRYPT_ROUNDS = config("BCRYPT_ROUNDS", cast=int, default=12)
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__time_cost=2,
+    argon2__memory_cost=19456,
+    argon2__parallelism=1,
+    bcrypt__rounds=BCRYPT_ROUNDS,
+)
+
+# Columns returned as the user's profile on login
+_USER_INFO_FIELDS = tuple(UserInfo.model_fields)
+
+# Built once so every request reuses the same cached compiled SQL.
+# Endpoints that need the face encoding or the password hash load them
+# with awaitable_attrs, most requests only read the profile columns.
+# Disabled accounts are filtered out by MySQL rather than fetched and rejected.
+_ACTIVE_USER_BY_USERNAME = (
+    select(User)
+    .options(defer(User.face_encoding), defer(User.hashed_password))
+    .where(User.username == bindparam("username"), User.is_active == true())
+    .limit(1)
+)
 
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_PREFIX}/v1/auth/login")
@@ -30,22 +60,83 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
-def create_access_token(subject: Union[str, Any]) -> str:
+def password_needs_update(hashed_password: str) -> bool:
+    """Check if a hash was made with an outdated scheme or cost and should be replaced"""
+    return pwd_context.needs_update(hashed_password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password against a hash without blocking the event loop"""
+    return await run_in_threadpool(pwd_context.verify, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """Generate password hash without blocking the event loop"""
+    return await run_in_threadpool(pwd_context.hash, password)
+
+
+@lru_cache(maxsize=1)
+def _dummy_password_hash() -> str:
+    """Hash checked for unknown users so their logins take as long as real ones"""
+    return pwd_context.hash("dummy-password-for-timing")
+
+
+def _verify_dummy_password(plain_password: str) -> bool:
+    """Spend one password verification without a user to check against"""
+    pwd_context.verify(plain_password, _dummy_password_hash())
+    return False
+
+
+async def verify_user_password(plain_password: str, user: Optional[User]) -> bool:
+    """Verify a login password, taking the same time whether or not the user exists"""
+    if user is None:
+        return await run_in_threadpool(_verify_dummy_password, plain_password)
+    return await verify_password_async(plain_password, user.hashed_password)
+
+
+def user_info_dict(user: User) -> Dict[str, Any]:
+    """Copy the UserInfo fields straight off a user row, without a model pass"""
+    return {field: getattr(user, field) for field in _USER_INFO_FIELDS}
+
+
+def access_token_claims(user: User) -> Dict[str, Any]:
+    """Build the identity claims embedded in access tokens"""
+    # Tokens are only signed, so contact details and free-form data stay out
+    return {
+        "uid": user.id,
+        "ver": user.token_version,
+        "act": user.is_active,
+        "name": user.name,
+        "role": "admin" if user.is_superuser else "user",
+    }
+
+
+def refresh_token_claims(user: User) -> Dict[str, Any]:
+    """Build the claims embedded in refresh tokens"""
+    return {"ver": user.token_version}
+
+
+def create_access_token(subject: Union[str, Any], claims: Optional[Dict[str, Any]] = None) -> str:
     """Create JWT access token"""
     expires_delta = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    expire = datetime.now(timezone.utc) + expires_delta
+    now = datetime.now(timezone.utc)
+    expire = now + expires_delta
     
-    to_encode = {"exp": expire, "sub": str(subject), "type": "access"}
+    to_encode = {"exp": expire, "iat": now, "sub": str(subject), "type": "access"}
+    if claims:
+        to_encode.update(claims)
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
 
-def create_refresh_token(subject: Union[str, Any]) -> str:
+def create_refresh_token(subject: Union[str, Any], claims: Optional[Dict[str, Any]] = None) -> str:
     """Create JWT refresh token with longer expiry"""
     expires_delta = timedelta(days=7)  # Refresh tokens typically last longer
     expire = datetime.utcnow() + expires_delta
     
     to_encode = {"exp": expire, "sub": str(subject), "type": "refresh"}
+    if claims:
+        to_encode.update(claims)
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
@@ -69,13 +160,13 @@ def verify_password_reset_token(token: str) -> Optional[str]:
         if payload.get("type") != "reset":
             return None
         return payload.get("sub")
-    except JWTError:
+    except InvalidTokenError:
         return None
 
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> User:
     """Get current user from JWT token"""
     credentials_exception = HTTPException(
@@ -84,6 +175,11 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
+    # Reuse the result of a recent validation of the same token
+    cached_user = await get_cached_user(token)
+    if cached_user is not None:
+        return await db.merge(cached_user, load=False)
+    
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
@@ -95,15 +191,33 @@ async def get_current_user(
             logger.warning("Invalid token payload")
             raise credentials_exception
             
-    except JWTError as e:
+    except InvalidTokenError as e:
         logger.warning(f"JWT error: {str(e)}")
         raise credentials_exception
     
-    user = db.query(User).filter(User.username == username).first()
+    # Tokens carrying the user id can be resolved from the user cache
+    user = None
+    user_id = payload.get("uid")
+    if user_id is not None:
+        user = await get_cached_user_by_id(user_id)
+        if user is not None and user.username == username:
+            user = await db.merge(user, load=False)
+        else:
+            user = None
+    
     if user is None:
-        logger.warning(f"User not found: {username}")
+        user = await db.scalar(_ACTIVE_USER_BY_USERNAME, {"username": username})
+        if user is None:
+            logger.warning(f"User not found or inactive: {username}")
+            raise credentials_exception
+        await cache_user_row(user)
+    
+    # Tokens issued before the user's token version was bumped are revoked
+    if payload.get("ver", 0) != (user.token_version or 0):
+        logger.warning(f"Revoked token used for user: {username}")
         raise credentials_exception
-        
+    
+    cache_user(token, user, payload.get("exp"))
     return user
 
 
@@ -111,9 +225,8 @@ async def get_current_active_user(
     current_user: User = Depends(get_current_user),
 ) -> User:
     """Check if current user is active"""
-    # Get the actual value from the SQLAlchemy model
-    is_active = getattr(current_user, "is_active", False)
-    if is_active is False or is_active == 0:
+    # Only rows served from the caches can still be inactive here
+    if not current_user.is_active:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Inactive user"
@@ -125,9 +238,7 @@ async def get_current_active_superuser(
     current_user: User = Depends(get_current_active_user),
 ) -> User:
     """Check if current user is a superuser"""
-    # Get the actual value from the SQLAlchemy model
-    is_superuser = getattr(current_user, "is_superuser", False)
-    if is_superuser is False or is_superuser == 0:
+    if not current_user.is_superuser:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not enough permissions"
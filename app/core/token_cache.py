@@ -0,0 +1,82 @@
+import hashlib
+import time
+from typing import Optional
+
+from cachetools import TTLCache
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.models.user import User
+from app.core.user_cache import get_cached_user_by_id
+
+# Validated access tokens are remembered for a short time so repeated
+# requests skip JWT verification. Invalidation only reaches this process,
+# so every hit is checked against the user row shared through Redis
+TOKEN_CACHE_TTL = 60
+TOKEN_CACHE_MAX_SIZE = 10_000
+
+_token_cache: TTLCache = TTLCache(
+    maxsize=TOKEN_CACHE_MAX_SIZE, ttl=TOKEN_CACHE_TTL
+)
+
+
+def _token_key(token: str) -> bytes:
+    """Hash a token into a compact cache key"""
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+def _snapshot_user(user: User) -> User:
+    """Copy the loaded columns of a user into a detached instance"""
+    unloaded = inspect(user).unloaded
+    values = {
+        attr.key: getattr(user, attr.key)
+        for attr in inspect(User).column_attrs
+        if attr.key not in unloaded
+    }
+    snapshot = User(**values)
+    make_transient_to_detached(snapshot)
+    return snapshot
+
+
+async def get_cached_user(token: str) -> Optional[User]:
+    """Get a detached copy of the user for an already validated token"""
+    key = _token_key(token)
+    entry = _token_cache.get(key)
+    if entry is None:
+        return None
+    
+    # Entries also expire with the token itself, which may be sooner than the TTL
+    expires_at, snapshot = entry
+    if expires_at <= time.time():
+        _token_cache.pop(key, None)
+        return None
+    
+    # Another worker may have revoked the token or deactivated the user.
+    # Their writes drop the shared row, so a missing row is not trusted either
+    row = await get_cached_user_by_id(snapshot.id)
+    if (
+        row is None
+        or not row.is_active
+        or (row.token_version or 0) != (snapshot.token_version or 0)
+    ):
+        _token_cache.pop(key, None)
+        return None
+    
+    # Callers attach it with session.merge(user, load=False), which needs no query
+    return snapshot
+
+
+def cache_user(token: str, user: User, token_exp: Optional[float] = None) -> None:
+    """Remember the user for a validated token until the TTL or token expiry"""
+    expires_at = time.time() + TOKEN_CACHE_TTL
+    if token_exp is not None:
+        expires_at = min(expires_at, token_exp)
+    
+    _token_cache[_token_key(token)] = (expires_at, _snapshot_user(user))
+
+
+def invalidate_user(user_id: int) -> None:
+    """Drop every cached token belonging to a user"""
+    for key, (_, snapshot) in list(_token_cache.items()):
+        if snapshot.id == user_id:
+            _token_cache.pop(key, None)
@@ -0,0 +1,108 @@
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import orjson
+import redis
+from redis import asyncio as aioredis
+from decouple import config
+from sqlalchemy import DateTime, inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.models.user import User
+from app.core.logger import logger
+
+# User rows are cached in Redis by id when REDIS_URL is configured.
+# Secrets and the face encoding are left out and load on first access.
+REDIS_URL = config("REDIS_URL", default="")
+USER_CACHE_TTL = 300
+_EXCLUDED_COLUMNS = frozenset({"hashed_password", "face_encoding"})
+
+_redis_client: Optional[aioredis.Redis] = None
+
+
+def get_redis() -> Optional[aioredis.Redis]:
+    """Get the shared Redis client, or None when caching is not configured"""
+    global _redis_client
+    if _redis_client is None and REDIS_URL:
+        _redis_client = aioredis.Redis.from_url(
+            str(REDIS_URL), socket_timeout=0.5, socket_connect_timeout=0.5
+        )
+    return _redis_client
+
+
+async def close_redis() -> None:
+    """Close the shared Redis client"""
+    global _redis_client
+    if _redis_client is not None:
+        await _redis_client.aclose()
+        _redis_client = None
+
+
+def _user_key(user_id: int) -> str:
+    """Redis key of a cached user row"""
+    return f"user:{user_id}"
+
+
+def _dump_user(user: User) -> bytes:
+    """Serialize the cacheable loaded columns of a user"""
+    unloaded = inspect(user).unloaded
+    values = {
+        attr.key: getattr(user, attr.key)
+        for attr in inspect(User).column_attrs
+        if attr.key not in unloaded and attr.key not in _EXCLUDED_COLUMNS
+    }
+    return orjson.dumps(values)
+
+
+def _load_user(data: bytes) -> User:
+    """Rebuild a detached user from a cached row"""
+    values: Dict[str, Any] = orjson.loads(data)
+    for attr in inspect(User).column_attrs:
+        value = values.get(attr.key)
+        if value is not None and isinstance(attr.columns[0].type, DateTime):
+            values[attr.key] = datetime.fromisoformat(value)
+    user = User(**values)
+    make_transient_to_detached(user)
+    return user
+
+
+async def get_cached_user_by_id(user_id: int) -> Optional[User]:
+    """Get a detached copy of a cached user by id"""
+    client = get_redis()
+    if client is None:
+        return None
+
+    try:
+        data = await client.get(_user_key(user_id))
+    except redis.RedisError as e:
+        logger.warning(f"User cache unavailable: {str(e)}")
+        return None
+    if data is None:
+        return None
+
+    # Callers attach it with session.merge(user, load=False), which needs no query
+    return _load_user(data)
+
+
+async def cache_user_row(user: User) -> None:
+    """Store a user row in the cache"""
+    client = get_redis()
+    if client is None:
+        return
+
+    try:
+        await client.setex(_user_key(user.id), USER_CACHE_TTL, _dump_user(user))
+    except redis.RedisError as e:
+        logger.warning(f"User cache unavailable: {str(e)}")
+
+
+async def invalidate_cached_user(user_id: int) -> None:
+    """Drop a user row from the cache"""
+    client = get_redis()
+    if client is None:
+        return
+
+    try:
+        await client.delete(_user_key(user_id))
+    except redis.RedisError as e:
+        logger.warning(f"User cache unavailable: {str(e)}")
@@ -0,0 +1,31 @@
+import hashlib
+from typing import Optional, Tuple
+
+from cachetools import TTLCache
+
+# Clients on flaky networks retry with the exact same frame, so recent
+# verification results are reused instead of rerunning the face model
+VERIFICATION_CACHE_TTL = 30
+VERIFICATION_CACHE_MAX_SIZE = 10_000
+
+_verification_cache: TTLCache = TTLCache(
+    maxsize=VERIFICATION_CACHE_MAX_SIZE, ttl=VERIFICATION_CACHE_TTL
+)
+
+
+def verification_key(user_id: int, image_data: bytes, stored_encoding: bytes) -> bytes:
+    """Fingerprint an image against the user's registered face"""
+    digest = hashlib.blake2b(digest_size=16, key=str(user_id).encode())
+    digest.update(stored_encoding)
+    digest.update(image_data)
+    return digest.digest()
+
+
+def get_cached_verification(key: bytes) -> Optional[Tuple[bool, float]]:
+    """Get a recent verification result for the same image"""
+    return _verification_cache.get(key)
+
+
+def cache_verification(key: bytes, is_match: bool, confidence: float) -> None:
+    """Remember a verification result for a short time"""
+    _verification_cache[key] = (is_match, confidence)
@@ -1,19 +1,31 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncAttrs, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 from decouple import config
 from loguru import logger
-from contextlib import contextmanager
-from typing import Generator
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Generator
 
 # Load environment variables
 DATABASE_URL = config("DATABASE_URL", default="mysql+pymysql://root:@localhost:3306/attendance_db")
-DB_POOL_SIZE = config("DB_POOL_SIZE", cast=int, default=5)
-DB_MAX_OVERFLOW = config("DB_MAX_OVERFLOW", cast=int, default=10)
-DB_POOL_TIMEOUT = config("DB_POOL_TIMEOUT", cast=int, default=30)
+# The API uses the asyncio driver for the same database
+ASYNC_DATABASE_URL = config(
+    "ASYNC_DATABASE_URL",
+    default=str(DATABASE_URL).replace("mysql+pymysql://", "mysql+aiomysql://", 1)
+)
+DB_POOL_SIZE = config("DB_POOL_SIZE", cast=int, default=20)
+DB_MAX_OVERFLOW = config("DB_MAX_OVERFLOW", cast=int, default=20)
+DB_POOL_TIMEOUT = config("DB_POOL_TIMEOUT", cast=int, default=5)
+DB_CONNECT_TIMEOUT = config("DB_CONNECT_TIMEOUT", cast=int, default=10)
+# Per-statement limit in milliseconds for SELECTs, 0 disables it
+DATABASE_STATEMENT_TIMEOUT = config("DATABASE_STATEMENT_TIMEOUT", cast=int, default=0)
+# Number of compiled SQL statements each engine keeps for reuse
+DB_QUERY_CACHE_SIZE = config("DB_QUERY_CACHE_SIZE", cast=int, default=1200)
 
-# Create SQLAlchemy engine with connection pooling
+# Create SQLAlchemy engines with connection pooling. The sync engine is only
+# used for table creation and the legacy routes.
 engine = create_engine(
     str(DATABASE_URL),
     pool_size=DB_POOL_SIZE,
@@ -21,13 +33,45 @@ engine = create_engine(
     pool_timeout=DB_POOL_TIMEOUT,
     pool_pre_ping=True,  # Verify connections before using them
     pool_recycle=3600,   # Recycle connections after 1 hour
+    pool_use_lifo=True,  # Reuse the most recent connections and let idle ones expire
+    query_cache_size=DB_QUERY_CACHE_SIZE,
+    connect_args={"connect_timeout": DB_CONNECT_TIMEOUT},
+)
+
+async_engine = create_async_engine(
+    str(ASYNC_DATABASE_URL),
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+    pool_use_lifo=True,
+    query_cache_size=DB_QUERY_CACHE_SIZE,
+    connect_args={"connect_timeout": DB_CONNECT_TIMEOUT},
 )
 
-# Create session factory
+
+def set_statement_timeout(dbapi_connection, connection_record):
+    """Cap SELECT execution time on every new connection"""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("SET SESSION max_execution_time = %s", (DATABASE_STATEMENT_TIMEOUT,))
+    finally:
+        cursor.close()
+
+
+if DATABASE_STATEMENT_TIMEOUT > 0:
+    event.listen(engine, "connect", set_statement_timeout)
+    event.listen(async_engine.sync_engine, "connect", set_statement_timeout)
+
+# Create session factories
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
 
-# Create base class for models
-Base = declarative_base()
+# Create base class for models, with awaitable access to unloaded attributes
+Base = declarative_base(cls=AsyncAttrs)
 
 def init_db() -> None:
     """Initialize database tables"""
@@ -43,24 +87,27 @@ def init_db() -> None:
         logger.error(f"Error initializing database: {str(e)}")
         raise
 
-def get_db() -> Generator:
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
     """Dependency for database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def get_sync_db() -> Generator:
+    """Dependency for a synchronous database session, used by the legacy routes"""
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
-@contextmanager
-def db_transaction():
+@asynccontextmanager
+async def db_transaction() -> AsyncGenerator[AsyncSession, None]:
     """Context manager for database transactions"""
-    db = SessionLocal()
-    try:
-        yield db
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        logger.error(f"Transaction error: {str(e)}")
-        raise
-    finally:
-        db.close() 
\ No newline at end of file
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Transaction error: {str(e)}")
+            raise 
\ No newline at end of file
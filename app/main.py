@@ -1,25 +1,21 @@
 from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from fastapi.exceptions import RequestValidationError
 from fastapi_pagination import add_pagination
-from loguru import logger
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.backends.redis import RedisBackend
+from redis import asyncio as aioredis
 import time
 import os
 from app.api.v1.router import api_router
 from app.core.config import settings
-from app.database.database import init_db
+from app.core.logger import logger
+from app.database.database import init_db, async_engine
+from app.services.face_recognition_service import get_face_service, run_face_task
+from app.core.user_cache import REDIS_URL, close_redis
 
-# Configure logger
-logger.add(
-    "logs/app.log",
-    rotation="10 MB",
-    retention="7 days",
-    level="INFO",
-    format="{time} {level} {message}",
-    backtrace=True,
-    diagnose=True,
-)
 
 def create_app() -> FastAPI:
     """Create and configure the FastAPI application"""
@@ -30,6 +26,7 @@ def create_app() -> FastAPI:
         docs_url="/api/docs",
         redoc_url="/api/redoc",
         openapi_url="/api/openapi.json",
+        default_response_class=ORJSONResponse,
     )
 
     # Configure CORS
@@ -44,17 +41,18 @@ def create_app() -> FastAPI:
     # Request processing time middleware
     @app.middleware("http")
     async def add_process_time_header(request: Request, call_next):
-        start_time = time.time()
+        start_time = time.perf_counter_ns()
         try:
             response = await call_next(request)
-            process_time = time.time() - start_time
-            response.headers["X-Process-Time"] = str(process_time)
-            logger.info(f"Request processed in {process_time:.4f}s: {request.method} {request.url}")
+            process_ms = (time.perf_counter_ns() - start_time) / 1e6
+            response.headers["X-Process-Time"] = f"{process_ms:.2f}ms"
+            # Arguments are only formatted when INFO is enabled
+            logger.info("Request processed in {:.2f}ms: {} {}", process_ms, request.method, request.url)
             return response
         except Exception as e:
-            process_time = time.time() - start_time
-            logger.error(f"Request failed in {process_time:.4f}s: {request.method} {request.url} - {str(e)}")
-            return JSONResponse(
+            process_ms = (time.perf_counter_ns() - start_time) / 1e6
+            logger.error("Request failed in {:.2f}ms: {} {} - {}", process_ms, request.method, request.url, e)
+            return ORJSONResponse(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 content={"detail": "Internal server error"}
             )
@@ -63,7 +61,7 @@ def create_app() -> FastAPI:
     @app.exception_handler(RequestValidationError)
     async def validation_exception_handler(request: Request, exc: RequestValidationError):
         logger.warning(f"Validation error: {exc.errors()}")
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             content={"detail": exc.errors()}
         )
@@ -81,10 +79,24 @@ def create_app() -> FastAPI:
         # Create database tables
         init_db()
         logger.info("Database initialized")
+        # Create the shared face recognition service and run the model once
+        # before the first request
+        await run_face_task(get_face_service().warm_up)
+        logger.info("Face recognition service initialized")
+        # Response cache, shared between workers when Redis is configured
+        if REDIS_URL:
+            FastAPICache.init(RedisBackend(aioredis.from_url(str(REDIS_URL))), prefix="fastapi-cache")
+        else:
+            FastAPICache.init(InMemoryBackend(), prefix="fastapi-cache")
+        logger.info("Response cache initialized")
 
     @app.on_event("shutdown")
     async def shutdown_event():
         logger.info("Shutting down application...")
+        await async_engine.dispose()
+        await close_redis()
+        # Flush messages still waiting in the log queue
+        await logger.complete()
 
     return app
 
@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Enum
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Enum, Index
 from sqlalchemy.orm import relationship
-from datetime import datetime, timezone
+from sqlalchemy.sql import func
 import enum
 from app.database.database import Base
 from app.models.mixins import TimestampMixin, UUIDMixin
@@ -25,10 +25,13 @@ class AttendanceStatus(str, enum.Enum):
 class Attendance(Base, TimestampMixin, UUIDMixin):
     """Attendance model for tracking user check-ins and check-outs"""
     __tablename__ = "attendances"
+    __table_args__ = (
+        Index("ix_att_user_time_type", "user_id", "attendance_time", "attendance_type"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    attendance_time = Column(DateTime, default=datetime.now(timezone.utc), nullable=False)
+    attendance_time = Column(DateTime, server_default=func.now(), nullable=False)
     attendance_type = Column(Enum(AttendanceType), nullable=False)
     status = Column(Enum(AttendanceStatus), default=AttendanceStatus.VERIFIED, nullable=False)
     confidence_score = Column(Float, nullable=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, LargeBinary, DateTime, Boolean, JSON
+from sqlalchemy import Column, Integer, String, LargeBinary, DateTime, Boolean, JSON, Index
 from sqlalchemy.orm import relationship
 from app.database.database import Base
 from app.models.mixins import TimestampMixin, UUIDMixin
@@ -7,6 +7,11 @@ from app.models.mixins import TimestampMixin, UUIDMixin
 class User(Base, TimestampMixin, UUIDMixin):
     """User model for authentication and identification"""
     __tablename__ = "users"
+    __table_args__ = (
+        Index("ix_users_is_active", "is_active"),
+        # Backs the admin user search on MySQL
+        Index("ix_users_fulltext", "username", "email", mysql_prefix="FULLTEXT"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(80), nullable=False)
@@ -23,6 +28,8 @@ class User(Base, TimestampMixin, UUIDMixin):
     is_active = Column(Boolean, default=True)
     is_superuser = Column(Boolean, default=False)
     last_login = Column(DateTime, nullable=True)
+    # Bumped to revoke every token issued before the change
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
     
     # Relationships
     attendances = relationship("Attendance", back_populates="user", cascade="all, delete-orphan")
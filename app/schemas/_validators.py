@@ -0,0 +1,43 @@
+import string
+from typing import Annotated, Optional, Union
+
+from pydantic import BeforeValidator
+
+from app.utils.image import decode_face_image
+
+# Characters a password must contain at least one of
+_DIGITS = frozenset(string.digits)
+_UPPERCASE = frozenset(string.ascii_uppercase)
+
+# Largest decoded face image accepted, and its base64 length
+MAX_FACE_IMAGE_BYTES = 2 * 1024 * 1024
+MAX_B64_FACE_LEN = 4 * ((MAX_FACE_IMAGE_BYTES + 2) // 3)
+# Room for a "data:image/...;base64," prefix
+_MAX_DATA_URL_PREFIX_LEN = 64
+# Room for CRLF line breaks every 76 characters in wrapped base64
+_MAX_LINE_BREAKS_LEN = 2 * (MAX_B64_FACE_LEN // 76)
+
+
+def _decode_face_field(value: Union[str, bytes]) -> bytes:
+    """Reject oversized face images by length before decoding them"""
+    if not isinstance(value, (str, bytes)):
+        raise ValueError('Face image must be a base64 string')
+    if len(value) > MAX_B64_FACE_LEN + _MAX_DATA_URL_PREFIX_LEN + _MAX_LINE_BREAKS_LEN:
+        raise ValueError('Face image is too large')
+    return decode_face_image(value)
+
+
+# Base64 (or data URL) face image, decoded once while the request is validated
+FaceImage = Annotated[bytes, BeforeValidator(_decode_face_field)]
+
+
+def validate_password_strength(value: Optional[str]) -> Optional[str]:
+    """Check a password has a digit and an uppercase letter"""
+    # The minimum length is enforced by the field's min_length
+    if value is None:
+        return value
+    if _DIGITS.isdisjoint(value):
+        raise ValueError('Password must contain at least one digit')
+    if _UPPERCASE.isdisjoint(value):
+        raise ValueError('Password must contain at least one uppercase letter')
+    return value
@@ -1,7 +1,8 @@
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional, List, Dict, Any
 from datetime import datetime, date
 from app.models.attendance import AttendanceType, AttendanceStatus
+from app.schemas._validators import FaceImage
 
 
 class AttendanceBase(BaseModel):
@@ -23,19 +24,12 @@ class AttendanceCreate(AttendanceBase):
 
 class AttendanceVerify(BaseModel):
     """Schema for verifying attendance with face recognition"""
-    face_image: str = Field(..., description="Base64 encoded image")
+    face_image: FaceImage = Field(..., min_length=1, description="Base64 encoded image")
     attendance_type: AttendanceType = Field(..., description="Type of attendance record")
     location: Optional[str] = Field(None, description="Location coordinates or description")
     device_info: Optional[str] = Field(None, description="Device information")
     ip_address: Optional[str] = Field(None, description="IP address")
     notes: Optional[str] = Field(None, max_length=500)
-    
-    @validator('face_image')
-    def validate_face_image(cls, v):
-        """Validate face image is provided"""
-        if not v:
-            raise ValueError('Face image is required')
-        return v
 
 
 class AttendanceResponse(BaseModel):
@@ -54,8 +48,7 @@ class AttendanceResponse(BaseModel):
     created_at: datetime
     updated_at: datetime
     
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class AttendanceUpdate(BaseModel):
@@ -1,29 +1,30 @@
-from pydantic import BaseModel, EmailStr, Field, validator
-from typing import Optional, Any, Union
+from pydantic import BaseModel, Field, StringConstraints, field_validator, model_validator
+from typing import Annotated, Optional, Any, Union
 from datetime import datetime
+from app.schemas._validators import FaceImage, validate_password_strength
 from app.schemas.user import UserBase
 
+# Login only needs the shape of an address to look it up, registration
+# keeps the full EmailStr validation
+EMAIL_RE = r'^[^@\s]+@[^@\s]+\.[^@\s]+$'
+LoginEmail = Annotated[str, StringConstraints(pattern=EMAIL_RE)]
+
 
 class UserCreate(UserBase):
     """Schema for user registration"""
     password: str = Field(..., min_length=8)
-    face_image: Optional[str] = None  # Base64 encoded image
+    face_image: Optional[FaceImage] = None  # Base64 encoded image
     
-    @validator('password')
+    @field_validator('password')
+    @classmethod
     def password_strength(cls, v):
         """Validate password strength"""
-        if len(v) < 8:
-            raise ValueError('Password must be at least 8 characters long')
-        if not any(char.isdigit() for char in v):
-            raise ValueError('Password must contain at least one digit')
-        if not any(char.isupper() for char in v):
-            raise ValueError('Password must contain at least one uppercase letter')
-        return v
+        return validate_password_strength(v)
 
 
 class UserLogin(BaseModel):
     """Schema for user login"""
-    email: EmailStr
+    email: LoginEmail
     password: str
 
 
@@ -72,16 +73,11 @@ class PasswordReset(BaseModel):
     token: str
     new_password: str = Field(..., min_length=8)
     
-    @validator('new_password')
+    @field_validator('new_password')
+    @classmethod
     def password_strength(cls, v):
         """Validate password strength"""
-        if len(v) < 8:
-            raise ValueError('Password must be at least 8 characters long')
-        if not any(char.isdigit() for char in v):
-            raise ValueError('Password must contain at least one digit')
-        if not any(char.isupper() for char in v):
-            raise ValueError('Password must contain at least one uppercase letter')
-        return v
+        return validate_password_strength(v)
 
 
 class PasswordChange(BaseModel):
@@ -89,41 +85,29 @@ class PasswordChange(BaseModel):
     current_password: str
     new_password: str = Field(..., min_length=8)
     
-    @validator('new_password')
+    @field_validator('new_password')
+    @classmethod
     def password_strength(cls, v):
         """Validate password strength"""
-        if len(v) < 8:
-            raise ValueError('Password must be at least 8 characters long')
-        if not any(char.isdigit() for char in v):
-            raise ValueError('Password must contain at least one digit')
-        if not any(char.isupper() for char in v):
-            raise ValueError('Password must contain at least one uppercase letter')
-        return v
+        return validate_password_strength(v)
     
-    @validator('new_password')
-    def passwords_match(cls, v, values):
+    @model_validator(mode='after')
+    def passwords_match(self):
         """Ensure new password is different from current password"""
-        if 'current_password' in values and v == values['current_password']:
+        if self.new_password == self.current_password:
             raise ValueError('New password must be different from current password')
-        return v
+        return self
 
 
 class FaceLoginRequest(BaseModel):
     """Schema for face login"""
     username: Optional[str] = None
-    email: Optional[EmailStr] = None
-    face_image: str  # Base64 encoded image
-    
-    @validator('face_image')
-    def validate_face_image(cls, v):
-        """Validate face image is provided"""
-        if not v:
-            raise ValueError('Face image is required')
-        return v
+    email: Optional[LoginEmail] = None
+    face_image: FaceImage = Field(..., min_length=1)  # Base64 encoded image
     
-    @validator('username', 'email')
-    def validate_identifier(cls, v, values):
+    @model_validator(mode='after')
+    def validate_identifier(self):
         """Ensure either username or email is provided"""
-        if not v and 'username' not in values and 'email' not in values:
+        if not self.username and not self.email:
             raise ValueError('Either username or email must be provided')
-        return v 
\ No newline at end of file
+        return self 
\ No newline at end of file
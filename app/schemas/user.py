@@ -1,6 +1,7 @@
-from pydantic import BaseModel, EmailStr, Field, validator
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, field_validator
 from typing import Optional, List, Dict, Any, Union
 from datetime import datetime
+from app.schemas._validators import FaceImage, validate_password_strength
 
 
 # Base User Schema
@@ -20,19 +21,14 @@ class UserBase(BaseModel):
 # Schema for creating a user
 class UserCreate(UserBase):
     password: str = Field(..., min_length=8)
-    face_image: Optional[str] = None  # Base64 encoded image
+    face_image: Optional[FaceImage] = None  # Base64 encoded image
     is_superuser: Optional[bool] = False
     
-    @validator('password')
+    @field_validator('password')
+    @classmethod
     def password_strength(cls, v):
         """Validate password strength"""
-        if len(v) < 8:
-            raise ValueError('Password must be at least 8 characters long')
-        if not any(char.isdigit() for char in v):
-            raise ValueError('Password must contain at least one digit')
-        if not any(char.isupper() for char in v):
-            raise ValueError('Password must contain at least one uppercase letter')
-        return v
+        return validate_password_strength(v)
 
 
 # Schema for updating a user
@@ -47,22 +43,15 @@ class UserUpdate(BaseModel):
     address: Optional[str] = None
     profile_picture: Optional[str] = None
     additional_data: Optional[Dict[str, Any]] = None
-    face_image: Optional[str] = None  # Base64 encoded image
+    face_image: Optional[FaceImage] = None  # Base64 encoded image
     is_active: Optional[bool] = None
     is_superuser: Optional[bool] = None
     
-    @validator('password')
+    @field_validator('password')
+    @classmethod
     def password_strength(cls, v):
         """Validate password strength if provided"""
-        if v is None:
-            return v
-        if len(v) < 8:
-            raise ValueError('Password must be at least 8 characters long')
-        if not any(char.isdigit() for char in v):
-            raise ValueError('Password must contain at least one digit')
-        if not any(char.isupper() for char in v):
-            raise ValueError('Password must contain at least one uppercase letter')
-        return v
+        return validate_password_strength(v)
 
 
 # Schema for user response
@@ -75,9 +64,7 @@ class UserResponse(UserBase):
     updated_at: datetime
     has_face_encoding: bool = False
     
-    class Config:
-        orm_mode = True
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # Schema for mobile app response
@@ -92,9 +79,7 @@ class MobileUserResponse(BaseModel):
     profile_picture: Optional[str] = None
     additional_data: Optional[Dict[str, Any]] = None
     
-    class Config:
-        orm_mode = True
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # Schema for attendance in user response
@@ -104,15 +89,11 @@ class AttendanceBrief(BaseModel):
     attendance_type: str
     status: str
     
-    class Config:
-        orm_mode = True
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # Schema for user with attendance
 class UserWithAttendance(UserResponse):
     attendances: List[AttendanceBrief] = []
     
-    class Config:
-        orm_mode = True
-        from_attributes = True 
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
@@ -1,7 +1,8 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, or_, extract
-from typing import List, Optional, Dict, Any
-from datetime import datetime, date, timedelta
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import case, func, and_, or_, extract, select, Select
+from typing import List, NamedTuple, Optional, Dict, Any
+from datetime import datetime, date, time, timedelta
+from functools import lru_cache
 import calendar
 
 from app.models.attendance import Attendance, AttendanceType, AttendanceStatus
@@ -9,12 +10,29 @@ from app.schemas.attendance import AttendanceCreate, AttendanceStatistics, Daily
 from app.core.logger import logger
 
 
+class MonthMeta(NamedTuple):
+    """Calendar facts about a month used by the statistics"""
+    days_in_month: int
+    weekend_mask: int  # bit day-1 is set when that day is a Saturday or Sunday
+
+
+@lru_cache(maxsize=64)
+def month_meta(year: int, month: int) -> MonthMeta:
+    """Get the length and weekend days of a month"""
+    first_weekday, days_in_month = calendar.monthrange(year, month)
+    weekend_mask = 0
+    for day in range(days_in_month):
+        if (first_weekday + day) % 7 >= 5:  # 5 = Saturday, 6 = Sunday
+            weekend_mask |= 1 << day
+    return MonthMeta(days_in_month, weekend_mask)
+
+
 class AttendanceService:
     """Service for attendance operations"""
     
     @staticmethod
-    def create_attendance(
-        db: Session,
+    async def create_attendance(
+        db: AsyncSession,
         user_id: int,
         attendance_type: AttendanceType,
         confidence_score: Optional[float] = None,
@@ -38,127 +56,153 @@ class AttendanceService:
         
         try:
             db.add(db_attendance)
-            db.commit()
-            db.refresh(db_attendance)
-            logger.info(f"Attendance created for user {user_id}: {attendance_type}")
+            await db.commit()
+            # MySQL has no RETURNING, so the server-set timestamps need a reload
+            await db.refresh(db_attendance)
+            logger.info("Attendance created for user {}: {}", user_id, attendance_type)
             return db_attendance
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             logger.error(f"Error creating attendance: {str(e)}")
             raise
     
     @staticmethod
-    def get_attendance_by_id(db: Session, attendance_id: int) -> Optional[Attendance]:
+    async def get_attendance_by_id(db: AsyncSession, attendance_id: int) -> Optional[Attendance]:
         """Get attendance by ID"""
-        return db.query(Attendance).filter(Attendance.id == attendance_id).first()
+        return await db.get(Attendance, attendance_id)
     
     @staticmethod
-    def get_user_attendances(
-        db: Session,
+    async def get_user_attendances(
+        db: AsyncSession,
         user_id: int,
         start_date: Optional[date] = None,
         end_date: Optional[date] = None,
         attendance_type: Optional[AttendanceType] = None
     ) -> List[Attendance]:
         """Get attendance records for a user with filtering options"""
-        query = db.query(Attendance).filter(Attendance.user_id == user_id)
-        
-        # Apply date filters if provided
+        query = AttendanceService.user_attendances_query(
+            user_id=user_id,
+            start_date=start_date,
+            end_date=end_date,
+            attendance_type=attendance_type
+        )
+        return list(await db.scalars(query))
+    
+    @staticmethod
+    def _time_range(start_date: Optional[date], end_date: Optional[date]):
+        """Match attendance times on the given days without wrapping the column"""
+        conditions = []
         if start_date:
-            query = query.filter(func.date(Attendance.attendance_time) >= start_date)
+            conditions.append(Attendance.attendance_time >= datetime.combine(start_date, time.min))
         if end_date:
-            query = query.filter(func.date(Attendance.attendance_time) <= end_date)
+            next_day = datetime.combine(end_date + timedelta(days=1), time.min)
+            conditions.append(Attendance.attendance_time < next_day)
+        return and_(*conditions)
+    
+    @staticmethod
+    def user_attendances_query(
+        user_id: int,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        attendance_type: Optional[AttendanceType] = None
+    ) -> Select:
+        """Build the unexecuted select for a user's attendance records"""
+        query = select(Attendance).where(Attendance.user_id == user_id)
+        
+        # Apply date filters if provided, as bare time ranges so the index is used
+        if start_date or end_date:
+            query = query.where(AttendanceService._time_range(start_date, end_date))
         
         # Apply attendance type filter if provided
         if attendance_type:
-            query = query.filter(Attendance.attendance_type == attendance_type)
+            query = query.where(Attendance.attendance_type == attendance_type)
         
         # Order by attendance time descending (most recent first)
-        query = query.order_by(Attendance.attendance_time.desc())
-        
-        return query.all()
+        return query.order_by(Attendance.attendance_time.desc())
+    
+    @staticmethod
+    def _last_time(attendance_type: AttendanceType):
+        """Latest time of one attendance type within a group"""
+        return func.max(case((Attendance.attendance_type == attendance_type, Attendance.attendance_time)))
     
     @staticmethod
-    def get_attendance_statistics(
-        db: Session,
+    async def get_attendance_statistics(
+        db: AsyncSession,
         user_id: int,
         month: int,
         year: int
     ) -> AttendanceStatistics:
         """Get attendance statistics for a user for a specific month"""
         # Get the number of days in the month
-        days_in_month = calendar.monthrange(year, month)[1]
+        meta = month_meta(year, month)
+        days_in_month = meta.days_in_month
         
         # Create date range for the month
         start_date = date(year, month, 1)
         end_date = date(year, month, days_in_month)
         
-        # Get all attendance records for the month
-        attendances = AttendanceService.get_user_attendances(
-            db=db,
-            user_id=user_id,
-            start_date=start_date,
-            end_date=end_date
-        )
-        
-        # Group attendances by date
-        attendance_by_date = {}
-        for attendance in attendances:
-            att_date = attendance.attendance_time.date()
-            if att_date not in attendance_by_date:
-                attendance_by_date[att_date] = []
-            attendance_by_date[att_date].append(attendance)
+        # One row per day with the latest check-in, check-out and break times
+        att_date = func.date(Attendance.attendance_time).label("att_date")
+        query = select(
+            att_date,
+            AttendanceService._last_time(AttendanceType.CHECK_IN).label("check_in"),
+            AttendanceService._last_time(AttendanceType.CHECK_OUT).label("check_out"),
+            AttendanceService._last_time(AttendanceType.BREAK_START).label("break_start"),
+            AttendanceService._last_time(AttendanceType.BREAK_END).label("break_end"),
+        ).where(
+            Attendance.user_id == user_id,
+            AttendanceService._time_range(start_date, end_date)
+        ).group_by(att_date)
+        days = {row.att_date: row for row in await db.execute(query)}
         
         # Initialize statistics
         total_days = days_in_month
-        present_days = len(attendance_by_date)
+        present_days = len(days)
         absent_days = total_days - present_days
         late_days = 0
         total_work_hours = 0
         daily_records = []
         
+        # Skip future dates by stopping at today in the current month
+        today = datetime.now().date()
+        if (year, month) == (today.year, today.month):
+            last_day = today.day
+        elif (year, month) < (today.year, today.month):
+            last_day = days_in_month
+        else:
+            last_day = 0
+        
         # Process each day in the month
-        for day in range(1, days_in_month + 1):
-            current_date = date(year, month, day)
-            
-            # Skip future dates
-            if current_date > datetime.now().date():
-                continue
-                
+        for day in range(1, last_day + 1):
             # Skip weekends (optional, based on requirements)
-            if current_date.weekday() >= 5:  # 5 = Saturday, 6 = Sunday
+            if (meta.weekend_mask >> (day - 1)) & 1:
                 continue
-                
+            
+            current_date = date(year, month, day)
             daily_record = DailyAttendance(date=current_date)
             
-            if current_date in attendance_by_date:
-                day_attendances = attendance_by_date[current_date]
-                
-                # Find check-in and check-out times
-                check_in = next((a for a in day_attendances if a.attendance_type == AttendanceType.CHECK_IN), None)
-                check_out = next((a for a in day_attendances if a.attendance_type == AttendanceType.CHECK_OUT), None)
+            row = days.get(current_date)
+            if row is not None:
+                check_in, check_out = row.check_in, row.check_out
                 
                 if check_in:
-                    daily_record.check_in = check_in.attendance_time
+                    daily_record.check_in = check_in
                     
                     # Check if late (e.g., after 9:00 AM)
-                    if check_in.attendance_time.hour > 9 or (check_in.attendance_time.hour == 9 and check_in.attendance_time.minute > 0):
+                    if check_in.hour > 9 or (check_in.hour == 9 and check_in.minute > 0):
                         late_days += 1
                         daily_record.status = "late"
                 
                 if check_out:
-                    daily_record.check_out = check_out.attendance_time
+                    daily_record.check_out = check_out
                     
                 # Calculate work time if both check-in and check-out exist
                 if check_in and check_out:
-                    work_minutes = (check_out.attendance_time - check_in.attendance_time).total_seconds() / 60
+                    work_minutes = (check_out - check_in).total_seconds() / 60
                     
                     # Subtract break time if available
-                    break_start = next((a for a in day_attendances if a.attendance_type == AttendanceType.BREAK_START), None)
-                    break_end = next((a for a in day_attendances if a.attendance_type == AttendanceType.BREAK_END), None)
-                    
-                    if break_start and break_end:
-                        break_minutes = (break_end.attendance_time - break_start.attendance_time).total_seconds() / 60
+                    if row.break_start and row.break_end:
+                        break_minutes = (row.break_end - row.break_start).total_seconds() / 60
                         daily_record.break_time = int(break_minutes)
                         work_minutes -= break_minutes
                     
@@ -186,8 +230,8 @@ class AttendanceService:
         )
     
     @staticmethod
-    def update_attendance(
-        db: Session,
+    async def update_attendance(
+        db: AsyncSession,
         attendance_id: int,
         attendance_time: Optional[datetime] = None,
         attendance_type: Optional[AttendanceType] = None,
@@ -195,7 +239,7 @@ class AttendanceService:
         notes: Optional[str] = None
     ) -> Optional[Attendance]:
         """Update an attendance record"""
-        attendance = AttendanceService.get_attendance_by_id(db, attendance_id)
+        attendance = await AttendanceService.get_attendance_by_id(db, attendance_id)
         if not attendance:
             return None
         
@@ -209,28 +253,30 @@ class AttendanceService:
             attendance.notes = notes
         
         try:
-            db.commit()
-            db.refresh(attendance)
-            logger.info(f"Attendance updated: {attendance_id}")
+            await db.commit()
+            # updated_at is set by MySQL on UPDATE and expires with the flush,
+            # reload just that column so the record stays readable
+            await db.refresh(attendance, ["updated_at"])
+            logger.info("Attendance updated: {}", attendance_id)
             return attendance
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             logger.error(f"Error updating attendance: {str(e)}")
             raise
     
     @staticmethod
-    def delete_attendance(db: Session, attendance_id: int) -> bool:
+    async def delete_attendance(db: AsyncSession, attendance_id: int) -> bool:
         """Delete an attendance record"""
-        attendance = AttendanceService.get_attendance_by_id(db, attendance_id)
+        attendance = await AttendanceService.get_attendance_by_id(db, attendance_id)
         if not attendance:
             return False
         
         try:
-            db.delete(attendance)
-            db.commit()
-            logger.info(f"Attendance deleted: {attendance_id}")
+            await db.delete(attendance)
+            await db.commit()
+            logger.info("Attendance deleted: {}", attendance_id)
             return True
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             logger.error(f"Error deleting attendance: {str(e)}")
             raise 
\ No newline at end of file
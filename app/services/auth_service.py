@@ -1,50 +1,102 @@
 from datetime import datetime, timedelta
 from typing import Optional, Union, Any, Dict
-from jose import JWTError, jwt
-from sqlalchemy.orm import Session
-import base64
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer
+from sqlalchemy import bindparam, or_, select, update
 
 from app.core.security import (
-    verify_password,
-    get_password_hash,
+    verify_user_password,
+    get_password_hash_async,
     create_access_token,
     create_refresh_token,
     create_password_reset_token,
     verify_password_reset_token
 )
 from app.models.user import User
+from app.database.database import db_transaction
 from app.schemas.auth import UserCreate
 from app.core.config import settings
 from app.core.logger import logger
+from app.core.token_cache import invalidate_user
+from app.core.user_cache import invalidate_cached_user
+
+# Lookup statements are built once so their compiled SQL is reused
+_USER_BY_USERNAME = select(User).where(User.username == bindparam("username")).limit(1)
+_USER_BY_EMAIL = select(User).where(User.email == bindparam("email")).limit(1)
+_USER_BY_IDENTIFIER = select(User).where(
+    or_(User.username == bindparam("username"), User.email == bindparam("email"))
+).order_by((User.username == bindparam("username")).desc()).limit(1)
+# Password checks never need the face encoding
+_AUTH_USER_BY_USERNAME = _USER_BY_USERNAME.options(defer(User.face_encoding))
+_AUTH_USER_BY_EMAIL = _USER_BY_EMAIL.options(defer(User.face_encoding))
 
 
 class AuthService:
     """Service for authentication operations"""
     
     @staticmethod
-    def get_user_by_username(db: Session, username: str) -> Optional[User]:
+    async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
         """Get a user by username"""
-        return db.query(User).filter(User.username == username).first()
+        return await db.scalar(_USER_BY_USERNAME, {"username": username})
     
     @staticmethod
-    def get_user_by_email(db: Session, email: str) -> Optional[User]:
+    async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
         """Get a user by email"""
-        return db.query(User).filter(User.email == email).first()
+        return await db.scalar(_USER_BY_EMAIL, {"email": email})
+    
+    @staticmethod
+    async def get_user_by_identifier(
+        db: AsyncSession,
+        username: Optional[str] = None,
+        email: Optional[str] = None
+    ) -> Optional[User]:
+        """Get a user by username or email in one query, preferring the username"""
+        if username and email:
+            return await db.scalar(_USER_BY_IDENTIFIER, {"username": username, "email": email})
+        if username:
+            return await AuthService.get_user_by_username(db, username)
+        if email:
+            return await AuthService.get_user_by_email(db, email)
+        return None
+    
+    @staticmethod
+    async def get_auth_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
+        """Get a user by username without loading the face encoding"""
+        return await db.scalar(_AUTH_USER_BY_USERNAME, {"username": username})
     
     @staticmethod
-    def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
+    async def get_auth_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
+        """Get a user by email without loading the face encoding"""
+        return await db.scalar(_AUTH_USER_BY_EMAIL, {"email": email})
+    
+    @staticmethod
+    async def get_registration_conflict(db: AsyncSession, username: str, email: str) -> Optional[str]:
+        """Get which of username or email is already registered, in one query"""
+        result = await db.execute(
+            select(User.username, User.email).where(
+                or_(User.username == username, User.email == email)
+            ).limit(2)
+        )
+        existing = result.all()
+        
+        if any(row.username == username for row in existing):
+            return "username"
+        if existing:
+            return "email"
+        return None
+    
+    @staticmethod
+    async def authenticate_user(db: AsyncSession, username: str, password: str) -> Optional[User]:
         """Authenticate a user with username and password"""
-        user = AuthService.get_user_by_username(db, username)
-        if not user:
-            return None
-        if not verify_password(password, user.hashed_password):
+        user = await AuthService.get_auth_user_by_username(db, username)
+        if not await verify_user_password(password, user):
             return None
         return user
     
     @staticmethod
-    def create_user(db: Session, user_data: UserCreate, face_encoding: Optional[bytes] = None) -> User:
+    async def create_user(db: AsyncSession, user_data: UserCreate, face_encoding: Optional[bytes] = None) -> User:
         """Create a new user"""
-        hashed_password = get_password_hash(user_data.password)
+        hashed_password = await get_password_hash_async(user_data.password)
         
         db_user = User(
             username=user_data.username,
@@ -59,83 +111,110 @@ class AuthService:
             additional_data=user_data.additional_data,
             face_encoding=face_encoding,
             is_active=True,
-            is_superuser=user_data.is_superuser if hasattr(user_data, 'is_superuser') else False
+            # Self-registration never grants admin rights
+            is_superuser=False
         )
         
         try:
             db.add(db_user)
-            db.commit()
-            db.refresh(db_user)
-            logger.info(f"User created: {user_data.username}")
+            await db.commit()
+            await db.refresh(db_user)
+            logger.info("User created: {}", user_data.username)
             return db_user
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             logger.error(f"Error creating user: {str(e)}")
             raise
     
     @staticmethod
-    def update_user_password(db: Session, user: User, new_password: str) -> User:
+    async def touch_last_login(user_id: int, login_time: datetime) -> None:
+        """Record a login time with a single UPDATE on its own session"""
+        try:
+            async with db_transaction() as db:
+                await db.execute(
+                    update(User).where(User.id == user_id).values(last_login=login_time)
+                )
+            await invalidate_cached_user(user_id)
+        except Exception as e:
+            logger.warning(f"Could not record last login for user {user_id}: {str(e)}")
+    
+    @staticmethod
+    async def rehash_password(user_id: int, password: str) -> None:
+        """Replace an outdated password hash after a successful login, on its own session"""
+        try:
+            hashed_password = await get_password_hash_async(password)
+            async with db_transaction() as db:
+                await db.execute(
+                    update(User).where(User.id == user_id).values(hashed_password=hashed_password)
+                )
+            await invalidate_cached_user(user_id)
+        except Exception as e:
+            logger.warning(f"Could not rehash password for user {user_id}: {str(e)}")
+    
+    @staticmethod
+    async def update_user_password(db: AsyncSession, user: User, new_password: str) -> User:
         """Update user password"""
-        hashed_password = get_password_hash(new_password)
+        hashed_password = await get_password_hash_async(new_password)
         user.hashed_password = hashed_password
+        # Revoke the tokens issued with the old password
+        user.token_version = (user.token_version or 0) + 1
         
         try:
-            db.commit()
-            db.refresh(user)
-            logger.info(f"Password updated for user: {user.username}")
+            await db.commit()
+            # updated_at is set by MySQL on UPDATE, reload just that column
+            await db.refresh(user, ["updated_at"])
+            invalidate_user(user.id)
+            await invalidate_cached_user(user.id)
+            logger.info("Password updated for user: {}", user.username)
             return user
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             logger.error(f"Error updating password: {str(e)}")
             raise
     
     @staticmethod
-    def update_user_face(db: Session, user: User, face_encoding: bytes) -> User:
+    async def update_user_face(db: AsyncSession, user: User, face_encoding: bytes) -> User:
         """Update user face encoding"""
         user.face_encoding = face_encoding
         
         try:
-            db.commit()
-            db.refresh(user)
-            logger.info(f"Face encoding updated for user: {user.username}")
+            await db.commit()
+            # updated_at is set by MySQL on UPDATE, reload just that column
+            await db.refresh(user, ["updated_at"])
+            logger.info("Face encoding updated for user: {}", user.username)
             return user
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             logger.error(f"Error updating face encoding: {str(e)}")
             raise
     
     @staticmethod
-    def deactivate_user(db: Session, user_id: int) -> Optional[User]:
-        """Deactivate a user account"""
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user:
-            return None
-        
-        user.is_active = False
+    async def set_user_active(db: AsyncSession, user_id: int, is_active: bool) -> bool:
+        """Set a user's active flag with a single UPDATE, False if there is no such user"""
         try:
-            db.commit()
-            db.refresh(user)
-            logger.info(f"User deactivated: {user.username}")
-            return user
+            result = await db.execute(
+                update(User).where(User.id == user_id).values(is_active=is_active)
+            )
+            if result.rowcount == 0:
+                await db.rollback()
+                return False
+            await db.commit()
         except Exception as e:
-            db.rollback()
-            logger.error(f"Error deactivating user: {str(e)}")
+            await db.rollback()
+            logger.error(f"Error updating active status for user {user_id}: {str(e)}")
             raise
+        
+        invalidate_user(user_id)
+        await invalidate_cached_user(user_id)
+        logger.info("User {}: ID {}", "reactivated" if is_active else "deactivated", user_id)
+        return True
     
     @staticmethod
-    def reactivate_user(db: Session, user_id: int) -> Optional[User]:
+    async def deactivate_user(db: AsyncSession, user_id: int) -> bool:
+        """Deactivate a user account"""
+        return await AuthService.set_user_active(db, user_id, False)
+    
+    @staticmethod
+    async def reactivate_user(db: AsyncSession, user_id: int) -> bool:
         """Reactivate a user account"""
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user:
-            return None
-        
-        user.is_active = True
-        try:
-            db.commit()
-            db.refresh(user)
-            logger.info(f"User reactivated: {user.username}")
-            return user
-        except Exception as e:
-            db.rollback()
-            logger.error(f"Error reactivating user: {str(e)}")
-            raise 
\ No newline at end of file
+        return await AuthService.set_user_active(db, user_id, True) 
\ No newline at end of file
@@ -1,16 +1,45 @@
 import os
+import threading
+import anyio
 import numpy as np
 from deepface import DeepFace
+from deepface.commons import distance as dst
 from PIL import Image
 import io
-import base64
 import cv2
-import tempfile
-from typing import Optional, Tuple, Union, List
+from typing import Optional, Tuple, Union, List, Callable, TypeVar
 import uuid
+from decouple import config
 
 from app.core.config import settings
 from app.core.logger import logger
+from app.utils.image import decode_image, fit_size
+from app.utils.face_encoding import quantize_int8, quantized_dot, load_encoding, is_quantized, l2_normalize
+
+T = TypeVar("T")
+
+# Basic image enhancement applied before detection, as a lookup table
+# equivalent to cv2.convertScaleAbs(img, alpha=1.2, beta=10)
+_CONTRAST_ALPHA = 1.2  # Contrast control (1.0 means no change)
+_CONTRAST_BETA = 10    # Brightness control (0 means no change)
+_CONTRAST_LUT = np.clip(
+    np.round(np.arange(256) * _CONTRAST_ALPHA + _CONTRAST_BETA), 0, 255
+).astype(np.uint8)
+
+# Optional YuNet model (face_detection_yunet_2023mar.onnx). When set, the
+# face is found once with OpenCV's FaceDetectorYN and only the crop is
+# handed to DeepFace, which then skips its own detector
+FACE_DETECTOR_MODEL = config("FACE_DETECTOR_MODEL", default="")
+FACE_DETECTOR_SCORE_THRESHOLD = config("FACE_DETECTOR_SCORE_THRESHOLD", cast=float, default=0.8)
+# Extra context kept around the detected box, as a fraction of its size
+FACE_CROP_MARGIN = 0.2
+
+# Process-wide face recognition service, created once at startup
+_face_service: Optional["FaceRecognitionService"] = None
+_face_service_lock = threading.Lock()
+
+# Limits concurrent face recognition calls to the number of CPU cores
+_face_limiter: Optional[anyio.CapacityLimiter] = None
 
 
 class FaceRecognitionService:
@@ -21,15 +50,76 @@ class FaceRecognitionService:
         self.distance_metric = settings.FACE_DISTANCE_METRIC
         self.threshold = settings.FACE_THRESHOLD
         self.enforce_detection = True
+        # Longest image side fed to the face detector
+        self.max_size = 800
+        # Build the model once, DeepFace keeps it by name and reuses it on every represent call
+        self.model = DeepFace.build_model(self.model_name)
+        # FaceDetectorYN keeps per-call state, so every worker thread gets its own
+        self._detectors = threading.local()
+        
+    def warm_up(self) -> None:
+        """Run the model once on a blank image so the first request skips graph setup"""
+        blank = np.zeros((self.max_size // 4, self.max_size // 4, 3), dtype=np.uint8)
+        DeepFace.represent(
+            img_path=blank,
+            model_name=self.model_name,
+            enforce_detection=False
+        )
+
+    def represent(self, image: np.ndarray) -> np.ndarray:
+        """Embed the face in an image array from preprocess_array"""
+        if not FACE_DETECTOR_MODEL:
+            return self._to_embedding(DeepFace.represent(
+                img_path=image,
+                model_name=self.model_name,
+                enforce_detection=self.enforce_detection
+            ))
+        
+        face = self.detect_face(image)
+        if face is None:
+            if self.enforce_detection:
+                raise ValueError("Face could not be detected")
+            face = image
+        # The face is already located, DeepFace only resizes and embeds it.
+        # The array is still BGR here, so only the crop is turned into RGB
+        return self._to_embedding(DeepFace.represent(
+            img_path=np.ascontiguousarray(face[..., ::-1]),
+            model_name=self.model_name,
+            enforce_detection=False,
+            detector_backend="skip"
+        ))
+
+    def detect_face(self, image: np.ndarray) -> Optional[np.ndarray]:
+        """Crop the most confident face found by YuNet in a BGR image, None if there is none"""
+        detector = getattr(self._detectors, "detector", None)
+        if detector is None:
+            detector = cv2.FaceDetectorYN.create(
+                FACE_DETECTOR_MODEL, "", (320, 320), FACE_DETECTOR_SCORE_THRESHOLD
+            )
+            self._detectors.detector = detector
+        
+        height, width = image.shape[:2]
+        detector.setInputSize((width, height))
+        _, faces = detector.detect(image)
+        if faces is None or len(faces) == 0:
+            return None
         
-    def process_face_image(self, base64_image: str) -> Optional[bytes]:
-        """Process face image from base64 string and extract face encoding"""
+        # Each row is x, y, w, h, five landmarks and the score
+        x, y, w, h = faces[int(np.argmax(faces[:, -1])), :4]
+        margin_x, margin_y = w * FACE_CROP_MARGIN, h * FACE_CROP_MARGIN
+        left, top = max(0, int(x - margin_x)), max(0, int(y - margin_y))
+        right, bottom = min(width, int(x + w + margin_x)), min(height, int(y + h + margin_y))
+        if right <= left or bottom <= top:
+            return None
+        return image[top:bottom, left:right]
+
+    def process_face_image(self, image_data: bytes) -> Optional[bytes]:
+        """Process a decoded face image and extract face encoding"""
         try:
-            # Decode base64 image
-            image_data = base64.b64decode(base64_image)
-            
             # Preprocess the image
             processed_image = self.preprocess_image(image_data)
+            if processed_image is None:
+                return None
             
             # Extract face encoding
             face_encoding = self.extract_face_encoding(processed_image)
@@ -38,168 +128,184 @@ class FaceRecognitionService:
                 logger.warning("No face detected in the image")
                 return None
                 
-            return face_encoding.tobytes()
+            if self.distance_metric == "euclidean":
+                # Raw euclidean distance depends on the embedding magnitude,
+                # which normalization would drop, so keep the float32 vector
+                return face_encoding.astype(np.float32).tobytes()
+            
+            # Store the unit-length encoding as int8 codes to cut storage and IO
+            return quantize_int8(l2_normalize(face_encoding))
         except Exception as e:
             logger.error(f"Error processing face image: {str(e)}")
             raise
 
-    def extract_face_encoding(self, image_data: bytes) -> Optional[np.ndarray]:
-        """Extract face encoding from image data"""
+    def extract_face_encoding(self, image: np.ndarray) -> Optional[np.ndarray]:
+        """Extract face encoding from a preprocessed image array"""
         try:
-            # Create a temporary file to save the image
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-                temp_file.write(image_data)
-                temp_file_path = temp_file.name
-
-            try:
-                # Extract face embedding using DeepFace
-                embedding = DeepFace.represent(
-                    img_path=temp_file_path,
-                    model_name=self.model_name,
-                    enforce_detection=self.enforce_detection
-                )
-                
-                # Convert to numpy array if not already
-                if not isinstance(embedding, np.ndarray):
-                    embedding = np.array(embedding)
-                    
-                return embedding
-            finally:
-                # Clean up the temporary file
-                if os.path.exists(temp_file_path):
-                    os.unlink(temp_file_path)
-                    
+            # Extract face embedding using DeepFace
+            return self.represent(image)
         except Exception as e:
             logger.error(f"Error in face encoding extraction: {str(e)}")
             return None
 
-    def verify_face(self, stored_encoding: bytes, new_image_data: bytes) -> Tuple[bool, float]:
+    def verify_face(self, stored_encoding: bytes, new_image: np.ndarray) -> Tuple[bool, float]:
         """Verify a face against a stored encoding"""
         try:
-            # Create temporary files for both images
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file1, \
-                 tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file2:
-                
-                # Convert stored encoding back to numpy array
-                stored_array = np.frombuffer(stored_encoding, dtype=np.float32)
-                
-                # Save the stored encoding to a temporary file
-                np.save(temp_file1.name, stored_array)
-                temp_file1_path = temp_file1.name
-                
-                # Save the new image to a temporary file
-                temp_file2.write(new_image_data)
-                temp_file2_path = temp_file2.name
-
-            try:
-                # Extract embedding from new image
-                new_embedding = DeepFace.represent(
-                    img_path=temp_file2_path,
-                    model_name=self.model_name,
-                    enforce_detection=self.enforce_detection
-                )
-                
-                # Calculate distance between embeddings
-                if self.distance_metric == "cosine":
-                    distance = self.cosine_distance(stored_array, new_embedding)
-                else:
-                    # Use DeepFace's built-in verification
-                    result = DeepFace.verify(
-                        img1_path=temp_file1_path,
-                        img2_path=temp_file2_path,
-                        model_name=self.model_name,
-                        distance_metric=self.distance_metric,
-                        enforce_detection=self.enforce_detection
-                    )
-                    distance = result.get("distance", float('inf'))
-                
-                # Determine if it's a match based on threshold
-                is_match = distance <= self.threshold
-                
-                # Calculate confidence score (0-100%)
-                confidence = max(0, min(100, 100 * (1 - distance / self.threshold)))
-                
-                return is_match, confidence
-            finally:
-                # Clean up temporary files
-                for path in [temp_file1_path, temp_file2_path]:
-                    if os.path.exists(path):
-                        os.unlink(path)
-                        
+            # Extract embedding from new image
+            new_embedding = self.represent(new_image)
+            
+            # Calculate distance between embeddings
+            if self.distance_metric == "cosine":
+                distance = 1 - self.cosine_score(stored_encoding, l2_normalize(new_embedding))
+            elif self.distance_metric == "euclidean_l2":
+                # Stored encodings are unit-length, so only the new embedding is normalized
+                stored_array = self.load_unit_encoding(stored_encoding)
+                distance = float(dst.findEuclideanDistance(stored_array, l2_normalize(new_embedding)))
+            else:
+                # Raw euclidean needs the magnitude, which int8 encodings no longer carry
+                if is_quantized(stored_encoding):
+                    logger.warning("Stored face encoding is normalized, euclidean verification needs a new enrollment")
+                    return False, 0.0
+                distance = float(dst.findEuclideanDistance(load_encoding(stored_encoding), new_embedding))
+            
+            # Determine if it's a match based on threshold
+            is_match = distance <= self.threshold
+            
+            # Calculate confidence score (0-100%)
+            confidence = max(0, min(100, 100 * (1 - distance / self.threshold)))
+            
+            return is_match, confidence
         except Exception as e:
             logger.error(f"Error in face verification: {str(e)}")
             return False, 0.0
 
-    def verify_face_from_base64(self, stored_encoding: bytes, base64_image: str) -> Tuple[bool, float]:
-        """Verify a face from base64 image against a stored encoding"""
+    def verify_face_cosine(self, stored_unit: np.ndarray, new_unit: np.ndarray) -> Tuple[bool, float]:
+        """Compare two unit-length embeddings with a single dot product"""
+        score = float(np.dot(stored_unit, new_unit))
+        return score >= 1 - self.threshold, score
+
+    def cosine_score(self, stored_encoding: bytes, new_unit: np.ndarray) -> float:
+        """Cosine similarity between a stored encoding and a unit-length embedding"""
+        if is_quantized(stored_encoding):
+            # Compare on int8 codes when the stored encoding is quantized
+            return quantized_dot(stored_encoding, quantize_int8(new_unit))
+        return float(np.dot(self.load_unit_encoding(stored_encoding), new_unit))
+
+    def load_unit_encoding(self, stored_encoding: bytes) -> np.ndarray:
+        """Load a stored encoding as a unit-length float32 vector"""
+        stored_array = load_encoding(stored_encoding)
+        if not is_quantized(stored_encoding):
+            # Encodings stored before normalization was introduced
+            stored_array = l2_normalize(stored_array)
+        return stored_array
+
+    def encode_face(self, image_data: Union[bytes, memoryview]) -> Optional[np.ndarray]:
+        """Extract a unit-length face encoding from raw image bytes"""
         try:
-            # Decode base64 image
-            image_data = base64.b64decode(base64_image)
-            
+            img = self.preprocess_array(image_data)
+            if img is None:
+                logger.error("Failed to decode image")
+                return None
+
+            # Hand the preprocessed array straight to the model, without
+            # re-encoding it to JPEG and writing it to a temporary file
+            face_encoding = self.represent(img)
+        except Exception as e:
+            logger.error(f"Error in face encoding extraction: {str(e)}")
+            return None
+        return l2_normalize(face_encoding)
+
+    def match_from_score(self, score: float) -> Tuple[bool, float]:
+        """Convert a cosine similarity score into a match flag and confidence"""
+        distance = 1 - score
+        is_match = distance <= self.threshold
+        confidence = max(0, min(100, 100 * (1 - distance / self.threshold)))
+        return is_match, confidence
+
+    def verify_face_from_bytes(self, stored_encoding: bytes, image_data: bytes) -> Tuple[bool, float]:
+        """Verify a face from raw image bytes against a stored encoding"""
+        try:
+            if self.distance_metric == "cosine":
+                # Decode, preprocess and embed in memory, then a single dot product
+                new_unit = self.encode_face(image_data)
+                if new_unit is None:
+                    return False, 0.0
+                return self.match_from_score(self.cosine_score(stored_encoding, new_unit))
+
             # Preprocess the image
             processed_image = self.preprocess_image(image_data)
+            if processed_image is None:
+                return False, 0.0
             
             # Verify face
             return self.verify_face(stored_encoding, processed_image)
         except Exception as e:
-            logger.error(f"Error in face verification from base64: {str(e)}")
+            logger.error(f"Error in face verification from bytes: {str(e)}")
             return False, 0.0
 
-    def preprocess_image(self, image_data: bytes) -> bytes:
+    def preprocess_array(self, image_data: Union[bytes, memoryview]) -> Optional[np.ndarray]:
+        """Decode and enhance an image into the array fed to the face model"""
+        max_size = self.max_size
+        # Decode straight to a reduced size when the image is much larger
+        img = decode_image(image_data, max_size)
+        if img is None:
+            return None
+
+        # Resize if image is too large, before any per-pixel pass
+        height, width = img.shape[:2]
+        target_size = fit_size(width, height, max_size)
+        if target_size is not None:
+            img = cv2.resize(img, target_size, interpolation=cv2.INTER_AREA)
+
+        # YuNet reads BGR, so keep the decoded channel order and let
+        # represent convert only the face crop
+        if FACE_DETECTOR_MODEL:
+            return _CONTRAST_LUT.take(img)
+
+        # Convert to RGB (DeepFace expects RGB) and adjust brightness and
+        # contrast in one pass: the table lookup writes a contiguous array
+        # while reading the channels in reverse order
+        return _CONTRAST_LUT.take(img[..., ::-1])
+
+    def preprocess_image(self, image_data: Union[bytes, memoryview]) -> Optional[np.ndarray]:
         """Preprocess image for better face detection"""
         try:
-            # Convert bytes to numpy array
-            nparr = np.frombuffer(image_data, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
+            img = self.preprocess_array(image_data)
             if img is None:
                 logger.error("Failed to decode image")
-                return image_data
-
-            # Convert to RGB (DeepFace expects RGB)
-            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-            # Resize if image is too large
-            max_size = 800
-            height, width = img_rgb.shape[:2]
-            if height > max_size or width > max_size:
-                scale = max_size / max(height, width)
-                new_width = int(width * scale)
-                new_height = int(height * scale)
-                img_rgb = cv2.resize(img_rgb, (new_width, new_height))
-
-            # Apply some basic image enhancements
-            # Adjust brightness and contrast if needed
-            alpha = 1.2  # Contrast control (1.0 means no change)
-            beta = 10    # Brightness control (0 means no change)
-            img_rgb = cv2.convertScaleAbs(img_rgb, alpha=alpha, beta=beta)
-
-            # Convert back to bytes
-            is_success, buffer = cv2.imencode(".jpg", img_rgb)
-            if is_success:
-                return buffer.tobytes()
-            return image_data
+            return img
         except Exception as e:
             logger.error(f"Error in image preprocessing: {str(e)}")
-            return image_data
+            return None
     
     @staticmethod
-    def cosine_distance(vector1: np.ndarray, vector2: np.ndarray) -> float:
-        """Calculate cosine distance between two vectors"""
-        if vector1 is None or vector2 is None:
-            return float('inf')
-            
-        vector1 = vector1.flatten()
-        vector2 = vector2.flatten()
-        
-        dot_product = np.dot(vector1, vector2)
-        norm_product = np.linalg.norm(vector1) * np.linalg.norm(vector2)
-        
-        if norm_product == 0:
-            return float('inf')
-            
-        similarity = dot_product / norm_product
-        # Convert similarity to distance (0 = identical, 2 = completely different)
-        distance = 1 - similarity
-        
-        return distance 
\ No newline at end of file
+    def _to_embedding(representation) -> np.ndarray:
+        """Convert a DeepFace representation into a flat float32 vector"""
+        # DeepFace returns one result per detected face, use the first one
+        if isinstance(representation, list) and representation and isinstance(representation[0], dict):
+            representation = representation[0]["embedding"]
+        return np.asarray(representation, dtype=np.float32).reshape(-1)
+
+
+def get_face_service() -> FaceRecognitionService:
+    """Get the shared face recognition service instance"""
+    global _face_service
+    if _face_service is None:
+        # Requests and worker threads can ask for it at the same time
+        with _face_service_lock:
+            if _face_service is None:
+                _face_service = FaceRecognitionService()
+    return _face_service
+
+
+def _get_face_limiter() -> anyio.CapacityLimiter:
+    """Get the face recognition capacity limiter, created inside the event loop"""
+    global _face_limiter
+    if _face_limiter is None:
+        _face_limiter = anyio.CapacityLimiter(os.cpu_count() or 1)
+    return _face_limiter
+
+
+async def run_face_task(func: Callable[..., T], *args) -> T:
+    """Run a blocking face recognition call in a worker thread"""
+    return await anyio.to_thread.run_sync(func, *args, limiter=_get_face_limiter())
\ No newline at end of file
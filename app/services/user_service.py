@@ -1,72 +1,108 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
-from typing import List, Optional, Dict, Any
-import base64
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer, selectinload
+from sqlalchemy import bindparam, or_, select, Select
+from sqlalchemy.dialects.mysql import match
+from typing import List, Optional, Dict, Any, Set
+import re
 
 from app.models.user import User
+from app.database.database import engine
 from app.schemas.user import UserCreate, UserUpdate
-from app.core.security import get_password_hash
-from app.services.face_recognition_service import FaceRecognitionService
+from app.core.security import get_password_hash_async
+from app.services.face_recognition_service import get_face_service, run_face_task
 from app.core.logger import logger
+from app.core.token_cache import invalidate_user
+from app.core.user_cache import get_cached_user_by_id, cache_user_row, invalidate_cached_user
+
+
+# InnoDB full-text search ignores words shorter than innodb_ft_min_token_size
+FULLTEXT_MIN_TOKEN_SIZE = 3
+_FULLTEXT_OPERATORS = re.compile(r'[+\-<>()~*"@]+')
+
+# Columns UserResponse never serializes; the encoding can be kilobytes per row
+_UNSERIALIZED_COLUMNS = (defer(User.face_encoding), defer(User.hashed_password))
+
+# Lookup statements are built once so their compiled SQL is reused
+_USER_BY_USERNAME = select(User).where(User.username == bindparam("username")).limit(1)
+_USER_BY_EMAIL = select(User).where(User.email == bindparam("email")).limit(1)
 
 
 class UserService:
     """Service for user operations"""
     
     @staticmethod
-    def get_by_id(db: Session, user_id: int) -> Optional[User]:
+    def _search_filter(search: str):
+        """Build the username/email search condition, full-text on MySQL"""
+        terms = _FULLTEXT_OPERATORS.sub(" ", search).split()
+        if (
+            engine.dialect.name == "mysql"
+            and terms
+            and all(len(term) >= FULLTEXT_MIN_TOKEN_SIZE for term in terms)
+        ):
+            # Every word must match, as a prefix of a username or email token
+            against = " ".join(f"+{term}*" for term in terms)
+            return match(User.username, User.email, against=against).in_boolean_mode()
+        return or_(
+            User.username.ilike(f"%{search}%"),
+            User.email.ilike(f"%{search}%")
+        )
+    
+    @staticmethod
+    async def get_by_id(db: AsyncSession, user_id: int) -> Optional[User]:
         """Get a user by ID"""
-        return db.query(User).filter(User.id == user_id).first()
+        return await db.get(User, user_id, options=_UNSERIALIZED_COLUMNS)
+    
+    @staticmethod
+    async def get_by_id_cached(db: AsyncSession, user_id: int) -> Optional[User]:
+        """Get a user by ID, served from the user cache when possible"""
+        cached_user = await get_cached_user_by_id(user_id)
+        if cached_user is not None:
+            return await db.merge(cached_user, load=False)
+        
+        user = await UserService.get_by_id(db, user_id)
+        if user:
+            await cache_user_row(user)
+        return user
     
     @staticmethod
-    def get_by_username(db: Session, username: str) -> Optional[User]:
+    async def get_by_username(db: AsyncSession, username: str) -> Optional[User]:
         """Get a user by username"""
-        return db.query(User).filter(User.username == username).first()
+        return await db.scalar(_USER_BY_USERNAME, {"username": username})
     
     @staticmethod
-    def get_by_email(db: Session, email: str) -> Optional[User]:
+    async def get_by_email(db: AsyncSession, email: str) -> Optional[User]:
         """Get a user by email"""
-        return db.query(User).filter(User.email == email).first()
+        return await db.scalar(_USER_BY_EMAIL, {"email": email})
     
     @staticmethod
-    def get_users(
-        db: Session,
-        skip: int = 0,
-        limit: int = 100,
+    def users_query(
         search: Optional[str] = None,
         is_active: Optional[bool] = None
-    ) -> List[User]:
-        """Get all users with filtering options"""
-        query = db.query(User)
+    ) -> Select:
+        """Build the unexecuted select for users with filtering options"""
+        query = select(User).options(*_UNSERIALIZED_COLUMNS)
         
         # Apply search filter if provided
         if search:
-            query = query.filter(
-                or_(
-                    User.username.ilike(f"%{search}%"),
-                    User.email.ilike(f"%{search}%")
-                )
-            )
+            query = query.where(UserService._search_filter(search))
         
         # Apply active status filter if provided
         if is_active is not None:
-            query = query.filter(User.is_active == is_active)
+            query = query.where(User.is_active == is_active)
         
-        # Apply pagination
-        query = query.offset(skip).limit(limit)
-        
-        return query.all()
+        # A stable order keeps pages from overlapping
+        return query.order_by(User.id)
     
     @staticmethod
-    def create_user(db: Session, user_data: UserCreate) -> User:
+    async def create_user(db: AsyncSession, user_data: UserCreate) -> User:
         """Create a new user"""
-        hashed_password = get_password_hash(user_data.password)
+        hashed_password = await get_password_hash_async(user_data.password)
         
         face_encoding = None
         if user_data.face_image:
             try:
-                face_service = FaceRecognitionService()
-                face_encoding = face_service.process_face_image(user_data.face_image)
+                face_service = get_face_service()
+                face_encoding = await run_face_task(face_service.process_face_image, user_data.face_image)
             except Exception as e:
                 logger.error(f"Error processing face image: {str(e)}")
                 # Continue without face encoding
@@ -77,40 +113,45 @@ class UserService:
             hashed_password=hashed_password,
             face_encoding=face_encoding,
             is_active=user_data.is_active,
-            is_superuser=user_data.is_superuser if hasattr(user_data, 'is_superuser') else False
+            is_superuser=bool(user_data.is_superuser)
         )
         
         try:
             db.add(db_user)
-            db.commit()
-            db.refresh(db_user)
-            logger.info(f"User created: {user_data.username}")
+            await db.commit()
+            # MySQL has no RETURNING, so the server-set timestamps need a reload
+            await db.refresh(db_user)
+            logger.info("User created: {}", user_data.username)
             return db_user
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             logger.error(f"Error creating user: {str(e)}")
             raise
     
     @staticmethod
-    def update_user(db: Session, user: User, user_data: UserUpdate) -> User:
-        """Update user information"""
-        # Update fields if provided
-        if user_data.username is not None:
-            user.username = user_data.username
-        if user_data.email is not None:
-            user.email = user_data.email
+    async def update_user(
+        db: AsyncSession,
+        user: User,
+        user_data: UserUpdate,
+        exclude: Optional[Set[str]] = None
+    ) -> User:
+        """Update user information, ignoring the fields named in exclude"""
+        # Update fields if provided, in one pass over the submitted values
+        updates = user_data.model_dump(
+            exclude_unset=True,
+            exclude_none=True,
+            exclude={"password", "face_image", *(exclude or ())}
+        )
+        for field, value in updates.items():
+            setattr(user, field, value)
         if user_data.password is not None:
-            user.hashed_password = get_password_hash(user_data.password)
-        if user_data.is_active is not None:
-            user.is_active = user_data.is_active
-        if user_data.is_superuser is not None:
-            user.is_superuser = user_data.is_superuser
+            user.hashed_password = await get_password_hash_async(user_data.password)
         
         # Process face image if provided
         if user_data.face_image:
             try:
-                face_service = FaceRecognitionService()
-                face_encoding = face_service.process_face_image(user_data.face_image)
+                face_service = get_face_service()
+                face_encoding = await run_face_task(face_service.process_face_image, user_data.face_image)
                 if face_encoding:
                     user.face_encoding = face_encoding
             except Exception as e:
@@ -118,40 +159,45 @@ class UserService:
                 # Continue without updating face encoding
         
         try:
-            db.commit()
-            db.refresh(user)
-            logger.info(f"User updated: {user.username}")
+            await db.commit()
+            await db.refresh(user)
+            invalidate_user(user.id)
+            await invalidate_cached_user(user.id)
+            logger.info("User updated: {}", user.username)
             return user
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             logger.error(f"Error updating user: {str(e)}")
             raise
     
     @staticmethod
-    def delete_user(db: Session, user_id: int) -> bool:
+    async def delete_user(db: AsyncSession, user_id: int) -> bool:
         """Delete a user"""
-        user = UserService.get_by_id(db, user_id)
+        # The attendance cascade needs the records loaded, lazy loads cannot run here
+        user = await db.scalar(
+            select(User)
+            .options(*_UNSERIALIZED_COLUMNS, selectinload(User.attendances))
+            .where(User.id == user_id)
+        )
         if not user:
             return False
         
         try:
-            db.delete(user)
-            db.commit()
-            logger.info(f"User deleted: ID {user_id}")
+            await db.delete(user)
+            await db.commit()
+            invalidate_user(user_id)
+            await invalidate_cached_user(user_id)
+            logger.info("User deleted: ID {}", user_id)
             return True
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             logger.error(f"Error deleting user: {str(e)}")
             raise
     
     @staticmethod
-    def get_user_with_attendance(db: Session, user_id: int):
+    async def get_user_with_attendance(db: AsyncSession, user_id: int):
         """Get user with recent attendance records"""
-        user = UserService.get_by_id(db, user_id)
-        if not user:
-            return None
-        
-        # Attendance records are loaded via relationship
-        # We can limit the number of records if needed
-        
-        return user 
\ No newline at end of file
+        # Load the attendance records in one extra query instead of lazily
+        return await db.scalar(
+            select(User).options(selectinload(User.attendances)).where(User.id == user_id)
+        ) 
\ No newline at end of file
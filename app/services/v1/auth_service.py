@@ -1,29 +1,49 @@
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Optional
-from jose import JWTError, jwt
+import time
+import jwt
+from jwt import InvalidTokenError
 from passlib.context import CryptContext
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from app.models.user import User
-import os
-from dotenv import load_dotenv
+from app.core.config import settings
 
-load_dotenv()
-
-# Configuration
-SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
-ALGORITHM = "HS256"
+# Configuration, shared with the rest of the application
+ALGORITHM = settings.ALGORITHM
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+_SECRET_BYTES = settings.SECRET_KEY.encode()
+
+
+@lru_cache(maxsize=1)
+def get_pwd_context() -> CryptContext:
+    """Build the password hashing context on first use"""
+    # New hashes use argon2id, bcrypt hashes still verify and are replaced on login
+    return CryptContext(
+        schemes=["argon2", "bcrypt"],
+        deprecated="auto",
+        argon2__time_cost=2,
+        argon2__memory_cost=19456,
+        argon2__parallelism=1,
+    )
+
+
+@lru_cache(maxsize=10000)
+def _decode_token_cached(token: str) -> dict:
+    """Verify a token signature once, repeated requests reuse the payload"""
+    return jwt.decode(token, _SECRET_BYTES, algorithms=[ALGORITHM])
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 class AuthService:
     @staticmethod
     def verify_password(plain_password: str, hashed_password: str) -> bool:
-        return pwd_context.verify(plain_password, hashed_password)
+        return get_pwd_context().verify(plain_password, hashed_password)
 
     @staticmethod
     def get_password_hash(password: str) -> str:
-        return pwd_context.hash(password)
+        return get_pwd_context().hash(password)
 
     @staticmethod
     def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -33,25 +53,52 @@ class AuthService:
         else:
             expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
         
-        to_encode.update({"exp": expire})
-        encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+        # The secret is shared with the main API, so the type is checked on decode
+        to_encode.update({"exp": expire, "type": "access"})
+        encoded_jwt = jwt.encode(to_encode, _SECRET_BYTES, algorithm=ALGORITHM)
         return encoded_jwt
 
     @staticmethod
     def decode_token(token: str) -> Optional[dict]:
         try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            return payload
-        except JWTError:
+            payload = _decode_token_cached(token)
+        except InvalidTokenError:
+            return None
+        # Cached payloads were checked when first decoded, expiry is checked every time
+        if payload.get("exp", 0) <= time.time():
+            return None
+        # Refresh and reset tokens are signed with the same secret
+        if payload.get("type") != "access":
             return None
+        return payload
 
     @staticmethod
     def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
-        user = db.query(User).filter(User.username == username).first()
+        user = db.scalar(select(User).where(User.username == username))
         if not user:
             return None
-        if not AuthService.verify_password(password, user.hashed_password):
+        verified, new_hash = get_pwd_context().verify_and_update(password, user.hashed_password)
+        if not verified:
+            return None
+        if new_hash:
+            user.hashed_password = new_hash
+            db.commit()
+        return user
+
+    @staticmethod
+    async def authenticate_user_async(db: Session, username: str, password: str) -> Optional[User]:
+        user = db.scalar(select(User).where(User.username == username))
+        if not user:
+            return None
+        # Hash verification is CPU-bound, run it off the event loop
+        verified, new_hash = await run_in_threadpool(
+            get_pwd_context().verify_and_update, password, user.hashed_password
+        )
+        if not verified:
             return None
+        if new_hash:
+            user.hashed_password = new_hash
+            db.commit()
         return user
 
     @staticmethod
@@ -3,10 +3,12 @@ import numpy as np
 from deepface import DeepFace
 from PIL import Image
 import io
-import base64
 import cv2
-from typing import Optional, Tuple
-import tempfile
+from typing import Optional, Tuple, Union
+from functools import lru_cache
+
+from app.utils.image import decode_image, fit_size
+from app.utils.face_encoding import load_encoding, l2_normalize, is_quantized
 
 class FaceRecognitionService:
     def __init__(self):
@@ -14,85 +16,77 @@ class FaceRecognitionService:
         self.distance_metric = "cosine"
         self.threshold = 0.4  # Adjust this threshold based on your needs
 
-    def extract_face_encoding(self, image_data: bytes) -> Optional[np.ndarray]:
+    def extract_face_encoding(self, image: np.ndarray) -> Optional[np.ndarray]:
         try:
-            # Create a temporary file to save the image
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-                temp_file.write(image_data)
-                temp_file_path = temp_file.name
-
-            # Extract face embedding using DeepFace
+            # Extract face embedding using DeepFace, straight from the decoded array
             embedding = DeepFace.represent(
-                img_path=temp_file_path,
+                img_path=image,
                 model_name=self.model_name,
                 enforce_detection=True
             )
 
-            # Clean up the temporary file
-            os.unlink(temp_file_path)
+            # DeepFace returns one result per detected face, use the first one
+            if isinstance(embedding, list) and embedding and isinstance(embedding[0], dict):
+                embedding = embedding[0]["embedding"]
 
-            return np.array(embedding)
+            return np.asarray(embedding, dtype=np.float32).reshape(-1)
         except Exception as e:
             print(f"Error in face encoding extraction: {str(e)}")
             return None
 
-    def verify_face(self, stored_encoding: bytes, new_image_data: bytes) -> Tuple[bool, float]:
+    def verify_face(self, stored_encoding: bytes, new_image: np.ndarray) -> Tuple[bool, float]:
         try:
-            # Create temporary files for both images
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file1, \
-                 tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file2:
-                
-                # Write stored encoding to temp file
-                temp_file1.write(stored_encoding)
-                # Write new image to temp file
-                temp_file2.write(new_image_data)
-
-                # Verify faces using DeepFace
-                result = DeepFace.verify(
-                    img1_path=temp_file1.name,
-                    img2_path=temp_file2.name,
-                    model_name=self.model_name,
-                    distance_metric=self.distance_metric,
-                    enforce_detection=True
-                )
-
-                # Clean up temporary files
-                os.unlink(temp_file1.name)
-                os.unlink(temp_file2.name)
+            # The stored encoding is already an embedding, only the new image is run through the model
+            new_encoding = self.extract_face_encoding(new_image)
+            if new_encoding is None:
+                return False, float('inf')
 
-                verified = result["verified"]
-                distance = result["distance"]
-
-                return verified, distance
+            verified, score = self.verify_face_cosine(
+                self.load_unit_encoding(stored_encoding), l2_normalize(new_encoding)
+            )
+            return verified, 1 - score
         except Exception as e:
             print(f"Error in face verification: {str(e)}")
             return False, float('inf')
 
     @staticmethod
-    def preprocess_image(image_data: bytes) -> bytes:
+    def load_unit_encoding(stored_encoding: bytes) -> np.ndarray:
+        """Load a stored encoding as a unit-length float32 vector"""
+        stored_array = load_encoding(stored_encoding)
+        if not is_quantized(stored_encoding):
+            # Encodings stored before normalization was introduced
+            stored_array = l2_normalize(stored_array)
+        return stored_array
+
+    def verify_face_cosine(self, stored_unit: np.ndarray, new_unit: np.ndarray) -> Tuple[bool, float]:
+        # Unit-length embeddings make cosine similarity a single dot product
+        score = float(np.dot(stored_unit, new_unit))
+        return score >= 1 - self.threshold, score
+
+    @staticmethod
+    def preprocess_image(image_data: Union[bytes, memoryview]) -> Optional[np.ndarray]:
         """Preprocess image for better face detection"""
+        max_size = 800
         try:
-            # Convert bytes to numpy array
-            nparr = np.frombuffer(image_data, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            # Decode straight to a reduced size when the image is much larger
+            img = decode_image(image_data, max_size)
+
+            # Resize if image is too large, before any per-pixel pass
+            height, width = img.shape[:2]
+            target_size = fit_size(width, height, max_size)
+            if target_size is not None:
+                img = cv2.resize(img, target_size, interpolation=cv2.INTER_AREA)
 
             # Convert to RGB (DeepFace expects RGB)
             img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
 
-            # Resize if image is too large
-            max_size = 800
-            height, width = img_rgb.shape[:2]
-            if height > max_size or width > max_size:
-                scale = max_size / max(height, width)
-                new_width = int(width * scale)
-                new_height = int(height * scale)
-                img_rgb = cv2.resize(img_rgb, (new_width, new_height))
-
-            # Convert back to bytes
-            is_success, buffer = cv2.imencode(".jpg", img_rgb)
-            if is_success:
-                return buffer.tobytes()
-            return image_data
+            return img_rgb
         except Exception as e:
             print(f"Error in image preprocessing: {str(e)}")
-            return image_data 
\ No newline at end of file
+            return None
+
+
+@lru_cache(maxsize=1)
+def get_face_service() -> FaceRecognitionService:
+    """Get the shared face recognition service instance"""
+    return FaceRecognitionService()
\ No newline at end of file
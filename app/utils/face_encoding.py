@@ -0,0 +1,101 @@
+import struct
+from typing import Tuple
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional, the NumPy kernel is used instead
+    njit = None
+
+# Quantized encodings are stored as a magic prefix, one int8 code per
+# dimension and the float32 (alpha, shift) pair that maps codes back to
+# the original range: value ~= alpha * code + shift
+QUANT_MAGIC = b"FEQ1"
+_QUANT_PARAMS = struct.Struct("<ff")
+
+
+def quantize_int8(vector: np.ndarray) -> bytes:
+    """Quantize a float face embedding to int8 codes with a per-vector scale"""
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    low = float(vector.min())
+    high = float(vector.max())
+
+    alpha = (high - low) / 255.0 or 1.0
+    shift = low + 128.0 * alpha
+    codes = np.clip(np.round((vector - shift) / alpha), -128, 127).astype(np.int8)
+
+    return QUANT_MAGIC + codes.tobytes() + _QUANT_PARAMS.pack(alpha, shift)
+
+
+def is_quantized(data: bytes) -> bool:
+    """Check if a stored encoding uses the int8 layout"""
+    return data[:len(QUANT_MAGIC)] == QUANT_MAGIC
+
+
+def unpack_int8(data: bytes) -> Tuple[np.ndarray, float, float]:
+    """Split an int8 encoding into its codes, alpha and shift"""
+    count = len(data) - len(QUANT_MAGIC) - _QUANT_PARAMS.size
+    codes = np.frombuffer(data, dtype=np.int8, count=count, offset=len(QUANT_MAGIC))
+    alpha, shift = _QUANT_PARAMS.unpack_from(data, len(data) - _QUANT_PARAMS.size)
+    return codes, alpha, shift
+
+
+def dequantize_int8(data: bytes) -> np.ndarray:
+    """Restore a float32 embedding from its int8 layout"""
+    codes, alpha, shift = unpack_int8(data)
+    return codes.astype(np.float32) * np.float32(alpha) + np.float32(shift)
+
+
+def _dot_i8_numpy(a: np.ndarray, b: np.ndarray) -> int:
+    """Integer dot product of two int8 code vectors"""
+    return int(np.dot(a.astype(np.int32), b.astype(np.int32)))
+
+
+if njit is not None:
+    @njit(cache=True, fastmath=True, boundscheck=False)
+    def dot_i8(a, b):
+        """Integer dot product of two int8 code vectors"""
+        acc = 0
+        for i in range(a.shape[0]):
+            acc += np.int32(a[i]) * np.int32(b[i])
+        return acc
+
+    # Compile the kernel at import so the first request does not pay for it
+    dot_i8(np.zeros(128, dtype=np.int8), np.zeros(128, dtype=np.int8))
+else:
+    dot_i8 = _dot_i8_numpy
+
+
+def quantized_dot(a: bytes, b: bytes) -> float:
+    """Dot product of two int8 encodings computed on their integer codes"""
+    codes_a, alpha_a, shift_a = unpack_int8(a)
+    codes_b, alpha_b, shift_b = unpack_int8(b)
+    if codes_a.shape != codes_b.shape:
+        raise ValueError("Face encoding dimensions do not match")
+
+    # Expand (alpha_a * qa + shift_a) . (alpha_b * qb + shift_b) so only
+    # the code dot product touches every dimension
+    return (
+        alpha_a * alpha_b * int(dot_i8(codes_a, codes_b))
+        + alpha_a * shift_b * int(codes_a.sum(dtype=np.int64))
+        + alpha_b * shift_a * int(codes_b.sum(dtype=np.int64))
+        + codes_a.shape[0] * shift_a * shift_b
+    )
+
+
+def load_encoding(data: bytes) -> np.ndarray:
+    """Load a stored face encoding as a float32 vector"""
+    if is_quantized(data):
+        return dequantize_int8(data)
+    # Encodings stored before quantization are raw float32 bytes
+    return np.frombuffer(data, dtype=np.float32)
+
+
+def l2_normalize(vector: np.ndarray) -> np.ndarray:
+    """Scale an embedding to unit length so cosine similarity is a dot product"""
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        return vector
+    return vector / norm
@@ -0,0 +1,109 @@
+import binascii
+import io
+from typing import Optional, Tuple, Union
+
+import cv2
+import numpy as np
+import pybase64
+from PIL import Image
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR
+    _turbo_jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):  # PyTurboJPEG is optional, OpenCV decodes instead
+    _turbo_jpeg = None
+
+_JPEG_MAGIC = b"\xff\xd8"
+_EXIF_ORIENTATION = 0x0112
+
+# Whitespace clients may wrap base64 payloads with
+_WHITESPACE = b" \t\r\n"
+_STRIP_WHITESPACE = dict.fromkeys(_WHITESPACE)
+
+# Decode flags that let libjpeg scale the image down while decoding
+_REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def decode_flag_for_size(image_data: Union[bytes, memoryview], max_size: int) -> int:
+    """Pick the smallest reduced decode that keeps the long side at least max_size"""
+    try:
+        # Only the header is parsed here, the pixels are not decoded
+        with Image.open(io.BytesIO(image_data)) as header:
+            long_side = max(header.size)
+    except Exception:
+        return cv2.IMREAD_COLOR
+
+    for factor, flag in _REDUCED_DECODE_FLAGS:
+        if long_side // factor >= max_size:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def _decode_jpeg_turbo(image_data: Union[bytes, memoryview], max_size: int) -> np.ndarray:
+    """Decode a JPEG to BGR with libjpeg-turbo, scaled down like the OpenCV path"""
+    width, height, _, _ = _turbo_jpeg.decode_header(image_data)
+    scaling_factor = None
+    for factor, _ in _REDUCED_DECODE_FLAGS:
+        if max(width, height) // factor >= max_size:
+            scaling_factor = (1, factor)
+            break
+    return _turbo_jpeg.decode(image_data, pixel_format=TJPF_BGR, scaling_factor=scaling_factor)
+
+
+def _exif_orientation(image_data: Union[bytes, memoryview]) -> int:
+    """Read the EXIF orientation of an image, 1 when it has none"""
+    try:
+        # Only the header and the EXIF block are parsed
+        with Image.open(io.BytesIO(image_data)) as header:
+            return header.getexif().get(_EXIF_ORIENTATION, 1)
+    except Exception:
+        return 1
+
+
+def decode_image(image_data: Union[bytes, memoryview], max_size: int) -> Optional[np.ndarray]:
+    """Decode an encoded image to BGR at no more resolution than max_size needs"""
+    # libjpeg-turbo ignores EXIF orientation, rotated photos are left to OpenCV
+    if (
+        _turbo_jpeg is not None
+        and bytes(image_data[:2]) == _JPEG_MAGIC
+        and _exif_orientation(image_data) == 1
+    ):
+        try:
+            return _decode_jpeg_turbo(image_data, max_size)
+        except Exception:
+            # Fall back to OpenCV for JPEGs libjpeg-turbo rejects
+            pass
+    buffer = np.frombuffer(image_data, dtype=np.uint8)
+    return cv2.imdecode(buffer, decode_flag_for_size(image_data, max_size))
+
+
+def fit_size(width: int, height: int, max_size: int) -> Optional[Tuple[int, int]]:
+    """Target (width, height) that fits the long side to max_size, None if it already fits"""
+    long_side = max(width, height)
+    if long_side <= max_size:
+        return None
+    if width >= height:
+        return max_size, max(1, round(height * max_size / width))
+    return max(1, round(width * max_size / height)), max_size
+
+
+def decode_face_image(image: Union[str, bytes]) -> bytes:
+    """Decode a base64 image, with or without a data URL prefix"""
+    # "data:image/jpeg;base64,..." carries the payload after the only comma
+    if isinstance(image, str):
+        payload = image[image.rfind(",") + 1:]
+    else:
+        # A memoryview slice hands the payload to the decoder without copying it
+        payload = memoryview(image)[image.rfind(b",") + 1:]
+    try:
+        return pybase64.b64decode(payload, validate=True)
+    except binascii.Error:
+        # Line-wrapped base64 (e.g. Android Base64.DEFAULT) is still accepted,
+        # the whitespace is only stripped when the strict decode fails
+        if isinstance(payload, str):
+            return pybase64.b64decode(payload.translate(_STRIP_WHITESPACE), validate=True)
+        return pybase64.b64decode(bytes(payload).translate(None, _WHITESPACE), validate=True)